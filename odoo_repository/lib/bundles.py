@@ -0,0 +1,205 @@
+# Copyright 2023 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
+"""Export and import the clones of the scanner storage as Git bundles.
+
+Usage (from the `odoo_repository` folder):
+
+    python -m lib.bundles export REPOSITORIES_PATH BUNDLES_PATH
+    python -m lib.bundles import BUNDLES_PATH REPOSITORIES_PATH
+
+A new scanner node can be bootstrapped from the bundles of an existing one
+instead of cloning every repository from scratch: the first fetch then
+downloads only the commits pushed since the export. The bundles can be
+imported with this tool, or restored by the scanner itself when it has to
+clone a repository (see the `bundles_path` parameter of the scanners).
+
+The bundles are listed in a `manifest.json` file, recording the remote
+branches of each repository and their commit at the time of the export.
+Partial clones are not exported, as they miss objects to bundle.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import pathlib
+import shutil
+import sys
+
+import git
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+REMOTE_REFS_PREFIX = "refs/remotes/origin/"
+
+
+def read_manifest(bundles_path):
+    """Return the manifest of the bundles stored in `bundles_path`.
+
+    It returns a dictionary `{"org/name": data}`, empty if there is no
+    manifest.
+    """
+    manifest_path = pathlib.Path(bundles_path, MANIFEST_NAME)
+    if not manifest_path.exists():
+        return {}
+    manifest = json.loads(manifest_path.read_text())
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported bundles manifest version in {manifest_path}")
+    return {f"{data['org']}/{data['name']}": data for data in manifest["repositories"]}
+
+
+def create_bundle(clone_path, bundle_path):
+    """Bundle the remote branches of the clone located at `clone_path`.
+
+    It returns the data of the bundle to record in the manifest, or `None`
+    if the clone cannot be bundled.
+    """
+    repo = git.Repo(clone_path)
+    try:
+        if repo.config_reader().has_option('remote "origin"', "promisor"):
+            _logger.warning("%s: partial clone, not bundled", clone_path)
+            return None
+        commits = {}
+        output = repo.git.for_each_ref(
+            "--format=%(objectname) %(refname)", REMOTE_REFS_PREFIX
+        )
+        for line in output.splitlines():
+            commit, ref = line.split(" ", 1)
+            branch = ref.removeprefix(REMOTE_REFS_PREFIX)
+            if branch != "HEAD":
+                commits[branch] = commit
+        if not commits:
+            _logger.warning("%s: no branch to bundle", clone_path)
+            return None
+        bundle_path.parent.mkdir(parents=True, exist_ok=True)
+        repo.git.bundle(
+            "create",
+            "--quiet",
+            str(bundle_path),
+            *(f"{REMOTE_REFS_PREFIX}{branch}" for branch in sorted(commits)),
+        )
+        head = repo.head.ref.name if not repo.head.is_detached else None
+        return {
+            "clone_url": repo.remotes.origin.url,
+            "head": head if head in commits else sorted(commits)[0],
+            "commits": commits,
+        }
+    finally:
+        repo.close()
+
+
+def restore_bundle(bundle_path, clone_path, clone_url, data):
+    """Restore the clone located at `clone_path` from a bundle.
+
+    The clone is configured to fetch from `clone_url` and its HEAD targets
+    the branch recorded in `data` (a manifest entry), without checking it
+    out: the working tree is populated by `git checkout <head>`.
+    The clone is removed if the bundle cannot be restored.
+    """
+    repo = git.Repo.init(clone_path)
+    try:
+        repo.git.bundle("verify", "--quiet", str(bundle_path))
+        repo.create_remote("origin", clone_url)
+        repo.git.fetch(
+            "--no-tags",
+            str(bundle_path),
+            f"+{REMOTE_REFS_PREFIX}*:{REMOTE_REFS_PREFIX}*",
+        )
+        for branch, commit in data["commits"].items():
+            if repo.commit(f"{REMOTE_REFS_PREFIX}{branch}").hexsha != commit:
+                raise ValueError(f"{bundle_path}: unexpected commit for {branch}")
+        repo.git.symbolic_ref("HEAD", f"refs/heads/{data['head']}")
+    except Exception:
+        shutil.rmtree(clone_path)
+        raise
+    finally:
+        repo.close()
+
+
+def export_bundles(repositories_path, bundles_path):
+    """Bundle all the clones of `repositories_path` in `bundles_path`.
+
+    Return the number of exported clones.
+    """
+    repositories_path = pathlib.Path(repositories_path)
+    bundles_path = pathlib.Path(bundles_path)
+    repositories = []
+    for git_dir in sorted(repositories_path.glob("*/*/.git")):
+        clone_path = git_dir.parent
+        org, name = clone_path.parent.name, clone_path.name
+        bundle = f"{org}/{name}.bundle"
+        _logger.info("Bundle %s/%s...", org, name)
+        data = create_bundle(clone_path, bundles_path.joinpath(bundle))
+        if data:
+            repositories.append(dict(org=org, name=name, bundle=bundle, **data))
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "repositories": repositories,
+    }
+    bundles_path.joinpath(MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+    return len(repositories)
+
+
+def import_bundles(bundles_path, repositories_path, checkout=True):
+    """Restore the clones bundled in `bundles_path` in `repositories_path`.
+
+    Repositories already cloned are skipped. Return the number of restored
+    clones.
+    """
+    bundles_path = pathlib.Path(bundles_path)
+    repositories_path = pathlib.Path(repositories_path)
+    count = 0
+    for full_name, data in read_manifest(bundles_path).items():
+        clone_path = repositories_path.joinpath(data["org"], data["name"])
+        if clone_path.exists():
+            _logger.info("%s already cloned, skipped", full_name)
+            continue
+        _logger.info("Restore %s...", full_name)
+        restore_bundle(
+            bundles_path.joinpath(data["bundle"]),
+            clone_path,
+            data["clone_url"],
+            data,
+        )
+        if checkout:
+            repo = git.Repo(clone_path)
+            try:
+                repo.git.checkout(data["head"])
+            finally:
+                repo.close()
+        count += 1
+    return count
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Bundle the clones")
+    export_parser.add_argument("repositories_path", help="Storage of the clones")
+    export_parser.add_argument("bundles_path", help="Folder receiving the bundles")
+    import_parser = subparsers.add_parser("import", help="Restore the clones")
+    import_parser.add_argument("bundles_path", help="Folder hosting the bundles")
+    import_parser.add_argument("repositories_path", help="Storage of the clones")
+    import_parser.add_argument(
+        "--no-checkout",
+        action="store_true",
+        help="Do not checkout the working tree of the clones",
+    )
+    args = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "export":
+        count = export_bundles(args.repositories_path, args.bundles_path)
+        print(f"{count} repositories exported")
+    else:
+        count = import_bundles(
+            args.bundles_path, args.repositories_path, checkout=not args.no_checkout
+        )
+        print(f"{count} repositories imported")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# Copyright 2023 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
+
+import contextlib
+import json
+import logging
+import sqlite3
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """Persistent cache of module analysis results, keyed by Git tree SHA.
+
+    A Git tree SHA identifies the whole content of a module, so the same
+    module found in several branches, forks or addons paths is analyzed
+    only once. The SLOC of each file (blob) are cached as well, so when a
+    module changes only its new or modified files have to be counted.
+
+    The cache is stored in a SQLite database and entries are evicted in
+    least-recently-used order once it holds more than `max_entries` module
+    analysis (or `max_blob_entries` file counts).
+    """
+
+    # Bump this version to invalidate cached data when the analysis changes
+    _version = 3
+    # Ratio of entries kept when the cache is full
+    _eviction_ratio = 0.9
+
+    # Number of SQL variables used per query
+    _chunk_size = 500
+
+    def __init__(self, path, max_entries=10000, max_blob_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        # Odoo modules have ~50 files on average
+        self.max_blob_entries = max_blob_entries or max_entries * 50
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS module_analysis ("
+                "tree_sha TEXT PRIMARY KEY, version INTEGER, "
+                "data TEXT, last_access REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS module_analysis_last_access "
+                "ON module_analysis (last_access)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blob_sloc ("
+                "blob_key TEXT PRIMARY KEY, version INTEGER, "
+                "language TEXT, code_count INTEGER, last_access REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS blob_sloc_last_access "
+                "ON blob_sloc (last_access)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Scanners running in parallel could share the same cache
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, tree_sha):
+        """Return the analysis data of `tree_sha`, or `None` if not cached."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM module_analysis WHERE tree_sha = ? AND version = ?",
+                (tree_sha, self._version),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE module_analysis SET last_access = ? WHERE tree_sha = ?",
+                (time.time(), tree_sha),
+            )
+        return json.loads(row[0])
+
+    def set(self, tree_sha, data):
+        """Store the analysis `data` of `tree_sha`."""
+        try:
+            data = json.dumps(data)
+        except (TypeError, ValueError):
+            # Manifest containing values that cannot be serialized, skip
+            _logger.debug("Analysis of tree %s cannot be cached", tree_sha)
+            return False
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO module_analysis VALUES (?, ?, ?, ?)",
+                (tree_sha, self._version, data, time.time()),
+            )
+            self._evict(conn, "module_analysis", "tree_sha", self.max_entries)
+        return True
+
+    def get_blobs_sloc(self, blob_keys):
+        """Return the cached SLOC of files identified by `blob_keys`.
+
+        It returns a dictionary `{blob_key: (language, code_count)}`
+        containing only the files found in the cache.
+        """
+        res = {}
+        now = time.time()
+        with self._connect() as conn:
+            for i in range(0, len(blob_keys), self._chunk_size):
+                keys = blob_keys[i : i + self._chunk_size]
+                placeholders = ", ".join("?" * len(keys))
+                rows = conn.execute(
+                    "SELECT blob_key, language, code_count FROM blob_sloc "
+                    f"WHERE version = ? AND blob_key IN ({placeholders})",
+                    (self._version, *keys),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE blob_sloc SET last_access = ? WHERE blob_key = ?",
+                    [(now, row[0]) for row in rows],
+                )
+                res.update({row[0]: (row[1], row[2]) for row in rows})
+        return res
+
+    def set_blobs_sloc(self, blobs_sloc):
+        """Store the SLOC of files `{blob_key: (language, code_count)}`."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO blob_sloc VALUES (?, ?, ?, ?, ?)",
+                [
+                    (key, self._version, language, code_count, now)
+                    for key, (language, code_count) in blobs_sloc.items()
+                ],
+            )
+            self._evict(conn, "blob_sloc", "blob_key", self.max_blob_entries)
+        return True
+
+    def _evict(self, conn, table, key_column, max_entries):
+        """Evict the least recently used entries of `table` if it is full."""
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if count <= max_entries:
+            return
+        to_evict = count - int(max_entries * self._eviction_ratio)
+        conn.execute(
+            f"DELETE FROM {table} WHERE {key_column} IN ("
+            f"SELECT {key_column} FROM {table} ORDER BY last_access LIMIT ?)",
+            (to_evict,),
+        )
+        _logger.info("Analysis cache: %s entries evicted from %s", to_evict, table)
@@ -0,0 +1,378 @@
+# Copyright 2023 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
+"""Git operations used by the scanners, behind a backend interface.
+
+Commits and trees are identified by their SHA, and paths are relative to the
+root of the repository ('' being the root tree itself).
+"""
+
+import heapq
+import logging
+import os
+import subprocess
+
+import git
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+_logger = logging.getLogger(__name__)
+
+
+class GitBackend:
+    """Interface of the Git operations used by the scanners."""
+
+    name = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def close(self):
+        """Release the resources (processes, file handles...) of the backend."""
+
+    def resolve(self, ref):
+        """Return the SHA of the commit `ref` points to, or `None`."""
+        raise NotImplementedError
+
+    def get_tree_sha(self, commit, path):
+        """Return the SHA of the tree `path` in `commit`, or `None`."""
+        raise NotImplementedError
+
+    def list_tree(self, commit, path):
+        """Return the entries of the tree `path` in `commit`.
+
+        It returns a dictionary `{name: type}` where type is 'tree', 'blob'
+        or 'commit' (sub-module), or `None` if `path` is not a tree.
+        """
+        raise NotImplementedError
+
+    def list_files(self, commit, path):
+        """Return the paths of all the files (blobs) under the tree `path`.
+
+        The tree is listed recursively in one pass. Sub-modules are omitted.
+        """
+        raise NotImplementedError
+
+    def diff_paths(self, from_commit, to_commit, paths):
+        """Return the files changed under `paths` between both commits.
+
+        Renames are not detected: a renamed file is reported with both its
+        old and new path.
+        """
+        raise NotImplementedError
+
+    def get_last_commits_of_paths(self, ref, paths):
+        """Return the last commit that touched each path of `paths` in `ref`.
+
+        History is simplified like `git log -- <paths>` does: a merge commit
+        is the last commit of a path if the path differs from every parent of
+        the merge (like `git log -n 1 -- <path>`). It returns a dictionary
+        `{path: last_commit}`, paths without history being omitted.
+        """
+        raise NotImplementedError
+
+    def fetch(self, refspecs, filter_=None, env=None):
+        """Fetch `refspecs` from the 'origin' remote."""
+        args = ["git", "fetch", "origin", "--no-tags"]
+        if filter_:
+            args.append(f"--filter={filter_}")
+        try:
+            subprocess.run(
+                args + list(refspecs),
+                cwd=self.path,
+                env=dict(os.environ, **(env or {})),
+                text=True,
+                capture_output=True,
+                check=True,
+            )
+        except subprocess.CalledProcessError as exc:
+            raise git.exc.GitCommandError(args, exc.returncode, exc.stderr) from exc
+
+
+class GitPythonBackend(GitBackend):
+    """Backend based on GitPython.
+
+    Objects are read through persistent `git cat-file --batch` processes,
+    other operations spawn a `git` process.
+    """
+
+    name = "gitpython"
+
+    def __init__(self, path, repo=None):
+        super().__init__(path)
+        # The `git.Repo` object could be shared with the caller
+        self._own_repo = repo is None
+        self.repo = repo or git.Repo(path)
+
+    def close(self):
+        if self._own_repo:
+            self.repo.close()
+
+    def resolve(self, ref):
+        try:
+            return self.repo.commit(ref).hexsha
+        except (git.BadName, ValueError):
+            return None
+
+    def _get_tree(self, commit, path):
+        tree = self.repo.commit(commit).tree
+        if not path:
+            return tree
+        try:
+            tree = tree / path
+        except KeyError:
+            return None
+        return tree if tree.type == "tree" else None
+
+    def get_tree_sha(self, commit, path):
+        tree = self._get_tree(commit, path)
+        return tree.hexsha if tree is not None else None
+
+    def list_tree(self, commit, path):
+        tree = self._get_tree(commit, path)
+        if tree is None:
+            return None
+        return {
+            # Same type than Git for sub-modules
+            item.name: "commit" if item.type == "submodule" else item.type
+            for item in tree
+        }
+
+    def list_files(self, commit, path):
+        args = ["-r", "-z", commit]
+        if path:
+            args += ["--", path]
+        output = self.repo.git.ls_tree(*args)
+        files = []
+        for entry in output.split("\0"):
+            if not entry:
+                continue
+            # Entries are formatted as '<mode> SP <type> SP <sha> TAB <path>'
+            info, file_path = entry.split("\t", 1)
+            if info.split(" ")[1] == "blob":
+                files.append(file_path)
+        return files
+
+    def diff_paths(self, from_commit, to_commit, paths):
+        output = self.repo.git.diff(
+            "--name-only",
+            "--no-renames",
+            "-z",
+            from_commit,
+            to_commit,
+            "--",
+            *(path or "." for path in paths),
+        )
+        return [path for path in output.split("\0") if path]
+
+    def get_last_commits_of_paths(self, ref, paths):
+        # All the paths are resolved in one walk of the `ref` history
+        # (instead of one `git log -n 1` per path), stopped as soon as each
+        # path got its commit.
+        # Files of merge commits are listed against their first parent, the
+        # paths hosting them being then compared to the other parents.
+        paths = set(paths)
+        commits = {}
+        if not paths:
+            return commits
+        proc = self.repo.git(c="core.quotePath=false").log(
+            "--pretty=format:%x00%H %P",
+            "--name-only",
+            "--diff-merges=first-parent",
+            ref,
+            "--",
+            *sorted(paths),
+            as_process=True,
+        )
+        try:
+            commit = None
+            for line in proc.stdout:
+                line = line.decode().rstrip("\n")
+                if line.startswith("\x00"):
+                    commit, *parents = line[1:].split()
+                    continue
+                # Look for the scanned path hosting the modified file
+                parts = line.split("/")
+                for i in range(len(parts) - 1, 0, -1):
+                    path = "/".join(parts[:i])
+                    if path in paths:
+                        if len(parents) == 1 or self._differs_from_parents(
+                            commit, parents[1:], path
+                        ):
+                            commits[path] = commit
+                            paths.remove(path)
+                        break
+                if not paths:
+                    break
+        finally:
+            # Stop the history walk if it is not yet finished
+            proc.proc.kill()
+            proc.proc.wait()
+        return commits
+
+    def _differs_from_parents(self, commit, parents, path):
+        """Check if the tree `path` of `commit` differs from all `parents`."""
+        tree_sha = self.get_tree_sha(commit, path)
+        return all(self.get_tree_sha(parent, path) != tree_sha for parent in parents)
+
+    def fetch(self, refspecs, filter_=None, env=None):
+        # Tags are not used by the scanner, and fetching them could download
+        # objects not reachable from the scanned branches
+        kwargs = {"no_tags": True}
+        if filter_:
+            kwargs["filter"] = filter_
+        with self.repo.git.custom_environment(**(env or {})):
+            self.repo.remotes.origin.fetch(refspecs, **kwargs)
+
+
+class Pygit2Backend(GitBackend):
+    """Backend based on libgit2 (pygit2), running in the current process.
+
+    NOTE: fetching is done with the `git` command as libgit2 supports neither
+    partial clones nor the protocol v2.
+    """
+
+    name = "libgit2"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.repo = pygit2.Repository(str(path))
+
+    def close(self):
+        self.repo.free()
+
+    def resolve(self, ref):
+        try:
+            return str(self.repo.revparse_single(ref).peel(pygit2.Commit).id)
+        except (KeyError, ValueError, pygit2.GitError):
+            return None
+
+    def _get_tree(self, commit, path):
+        tree = self.repo[commit].peel(pygit2.Tree)
+        if not path:
+            return tree
+        try:
+            obj = tree[path]
+        except KeyError:
+            return None
+        return obj if obj.type == pygit2.GIT_OBJECT_TREE else None
+
+    def get_tree_sha(self, commit, path):
+        tree = self._get_tree(commit, path)
+        return str(tree.id) if tree is not None else None
+
+    def list_tree(self, commit, path):
+        tree = self._get_tree(commit, path)
+        if tree is None:
+            return None
+        return {entry.name: entry.type_str for entry in tree}
+
+    def list_files(self, commit, path):
+        tree = self._get_tree(commit, path)
+        if tree is None:
+            return []
+        files = []
+        trees = [(f"{path}/" if path else "", tree)]
+        while trees:
+            prefix, tree = trees.pop()
+            for entry in tree:
+                if entry.type_str == "tree":
+                    trees.append((f"{prefix}{entry.name}/", self.repo[entry.id]))
+                elif entry.type_str == "blob":
+                    files.append(f"{prefix}{entry.name}")
+        return files
+
+    def diff_paths(self, from_commit, to_commit, paths):
+        prefixes = tuple(f"{path}/" for path in paths)
+        if "" in paths:
+            # Root folder
+            prefixes = ("",)
+        diff = self.repo.diff(from_commit, to_commit)
+        res = set()
+        for delta in diff.deltas:
+            for path in (delta.old_file.path, delta.new_file.path):
+                if path.startswith(prefixes):
+                    res.add(path)
+        return sorted(res)
+
+    def _get_entries(self, commit, paths):
+        """Return the SHA of `paths` entries in `commit` (`None` if missing)."""
+        res = []
+        for path in paths:
+            try:
+                res.append(commit.tree[path].id)
+            except KeyError:
+                res.append(None)
+        return res
+
+    def get_last_commits_of_paths(self, ref, paths):
+        # Walk the history by commit date, simplified as 'git log' does: a
+        # merge commit identical to one of its parents for `paths` is
+        # replaced by this parent, others are attributed to the paths which
+        # differ from all their parents.
+        paths = sorted(set(paths))
+        commits = {}
+        if not paths:
+            return commits
+        pending = set(paths)
+        head = self.repo.revparse_single(ref).peel(pygit2.Commit)
+        queue = [(-head.commit_time, 0, head)]
+        seen = {head.id}
+        counter = 1
+        while queue and pending:
+            __, __, commit = heapq.heappop(queue)
+            entries = self._get_entries(commit, paths)
+            parents = commit.parents
+            if len(parents) > 1:
+                parents_entries = [
+                    self._get_entries(parent, paths) for parent in parents
+                ]
+                if entries in parents_entries:
+                    parents = [parents[parents_entries.index(entries)]]
+                else:
+                    for i, (path, entry) in enumerate(zip(paths, entries)):
+                        if path in pending and all(
+                            parent_entries[i] != entry
+                            for parent_entries in parents_entries
+                        ):
+                            commits[path] = str(commit.id)
+                            pending.remove(path)
+            elif parents:
+                parent_entries = self._get_entries(parents[0], paths)
+                for path, entry, parent_entry in zip(paths, entries, parent_entries):
+                    if path in pending and entry != parent_entry:
+                        commits[path] = str(commit.id)
+                        pending.remove(path)
+            else:
+                for path, entry in zip(paths, entries):
+                    if path in pending and entry is not None:
+                        commits[path] = str(commit.id)
+                        pending.remove(path)
+            for parent in parents:
+                if parent.id not in seen:
+                    seen.add(parent.id)
+                    heapq.heappush(queue, (-parent.commit_time, counter, parent))
+                    counter += 1
+        return commits
+
+
+BACKENDS = {
+    GitPythonBackend.name: GitPythonBackend,
+    Pygit2Backend.name: Pygit2Backend,
+}
+
+
+def get_backend(name, path, **kwargs):
+    """Return the Git backend `name` for the repository located at `path`."""
+    if name == Pygit2Backend.name and pygit2 is None:
+        _logger.warning("pygit2 is not installed, fallback on GitPython backend")
+        name = GitPythonBackend.name
+    backend_cls = BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Unknown Git backend '{name}'")
+    if backend_cls is not GitPythonBackend:
+        # Only used by GitPython backend
+        kwargs.pop("repo", None)
+    return backend_cls(path, **kwargs)
@@ -0,0 +1,188 @@
+# Copyright 2023 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
+"""Measure the latency of the Git queries run by the scanners on a clone.
+
+Usage (from the `odoo_repository` folder):
+
+    python -m lib.git_benchmark REPO_PATH [--ref REF] [--addons-path PATH]
+
+Path-limited queries (last commit of each module, history walk of all the
+modules at once) are run with and without the commit-graph of the clone,
+to measure the gain of its changed-path Bloom filters.
+
+With `--compare-backends`, the operations of the scanners are run with each
+Git backend (see `git_backends`) instead.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+from .git_backends import BACKENDS, get_backend
+
+
+def _git(repo_path, *args, config=None):
+    cmd = ["git"]
+    for key, value in (config or {}).items():
+        cmd += ["-c", f"{key}={value}"]
+    return subprocess.run(
+        cmd + list(args),
+        cwd=repo_path,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def _get_module_paths(repo_path, ref, addons_path, limit):
+    prefix = "" if addons_path in ("", ".") else f"{addons_path.strip('/')}/"
+    paths = _git(
+        repo_path, "ls-tree", "-d", "--name-only", f"{ref}:{prefix}"
+    ).splitlines()
+    return [f"{prefix}{path}" for path in paths[:limit]]
+
+
+def _time(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _get_queries(repo_path, ref, paths):
+    """Return the queries to measure as a list of `(name, func(config))`."""
+
+    def last_commit_of_each_path(config):
+        for path in paths:
+            _git(repo_path, "log", "-1", "--format=%H", ref, "--", path, config=config)
+
+    def history_of_all_paths(config):
+        _git(
+            repo_path,
+            "log",
+            "--format=%x00%H",
+            "--name-only",
+            ref,
+            "--",
+            *paths,
+            config=config,
+        )
+
+    return [
+        (f"'git log -1' of {len(paths)} path(s)", last_commit_of_each_path),
+        (f"'git log' of {len(paths)} path(s)", history_of_all_paths),
+    ]
+
+
+def run(repo_path, ref="HEAD", addons_path=".", limit=50, write=False):
+    """Measure the queries with and without commit-graph.
+
+    It returns a list of `(query, time_without, time_with)`.
+    """
+    if write:
+        _git(
+            repo_path,
+            "commit-graph",
+            "write",
+            "--reachable",
+            "--changed-paths",
+            "--split",
+        )
+    paths = _get_module_paths(repo_path, ref, addons_path, limit)
+    res = []
+    for name, query in _get_queries(repo_path, ref, paths):
+        time_without = _time(lambda: query({"core.commitGraph": "false"}))
+        time_with = _time(lambda: query({"core.commitGraph": "true"}))
+        res.append((name, time_without, time_with))
+    return res
+
+
+def run_backends(repo_path, ref="HEAD", addons_path=".", limit=50, depth=100):
+    """Measure the operations of the scanners with each Git backend.
+
+    It returns a dictionary `{operation: {backend: time}}`.
+    """
+    tree_path = "" if addons_path in ("", ".") else addons_path.strip("/")
+    res = {}
+    for name in BACKENDS:
+        backend = get_backend(name, repo_path)
+        if backend.name != name:
+            # Backend not available
+            continue
+        try:
+            commit = backend.resolve(ref)
+            from_commit = backend.resolve(f"{ref}~{depth}") or commit
+            paths = [
+                f"{tree_path}/{entry}" if tree_path else entry
+                for entry, type_ in sorted(backend.list_tree(commit, tree_path).items())
+                if type_ == "tree"
+            ][:limit]
+            operations = [
+                ("resolve ref", lambda: backend.resolve(ref)),
+                (
+                    f"list {len(paths)} module(s)",
+                    lambda: [backend.list_tree(commit, path) for path in paths],
+                ),
+                (
+                    f"diff over {depth} commit(s)",
+                    lambda: backend.diff_paths(from_commit, commit, [tree_path]),
+                ),
+                (
+                    f"last commits of {len(paths)} module(s)",
+                    lambda: backend.get_last_commits_of_paths(commit, paths),
+                ),
+            ]
+            for operation, func in operations:
+                res.setdefault(operation, {})[name] = _time(func)
+        finally:
+            backend.close()
+    return res
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("repo_path", help="Path of the clone")
+    parser.add_argument("--ref", default="HEAD", help="Ref to query (default: HEAD)")
+    parser.add_argument(
+        "--addons-path", default=".", help="Folder hosting the modules (default: .)"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=50, help="Number of modules queried (default: 50)"
+    )
+    parser.add_argument(
+        "--write", action="store_true", help="Write the commit-graph first"
+    )
+    parser.add_argument(
+        "--compare-backends",
+        action="store_true",
+        help="Compare the Git backends instead of the commit-graph",
+    )
+    args = parser.parse_args(args)
+    if args.compare_backends:
+        res = run_backends(
+            args.repo_path, ref=args.ref, addons_path=args.addons_path, limit=args.limit
+        )
+        for operation, times in res.items():
+            print(
+                f"{operation}: "
+                + " ".join(f"{name}={time_:.3f}s" for name, time_ in times.items())
+            )
+        return 0
+    res = run(
+        args.repo_path,
+        ref=args.ref,
+        addons_path=args.addons_path,
+        limit=args.limit,
+        write=args.write,
+    )
+    for name, time_without, time_with in res:
+        print(
+            f"{name}: without commit-graph={time_without:.2f}s "
+            f"with commit-graph={time_with:.2f}s "
+            f"(x{time_without / (time_with or 1e-9):.1f})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# Copyright 2023 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
+"""Run a scanner in a child process with memory and CPU time limits.
+
+The scanner is forked, so the Git and analysis work (and the memory it
+allocates) never happens in the calling process. Hook methods of the
+scanner (see `_hooks`) are not run by the child: their calls are sent to
+the calling process which runs them and returns their result, so data
+are still written by the caller (e.g. in the database of an Odoo worker).
+Arguments and results of the hooks are pickled, so they have to be plain
+data (e.g. IDs instead of Odoo records).
+"""
+
+import functools
+import logging
+import multiprocessing
+import pickle
+import resource
+import traceback
+
+_logger = logging.getLogger(__name__)
+
+# Seconds between two checks of the child process status
+POLL_INTERVAL = 1
+
+
+class ScannerProcessError(RuntimeError):
+    """The scanner failed or has been killed in its child process."""
+
+
+def limit_memory(memory_limit):
+    """Bound the memory the current process can allocate.
+
+    `memory_limit` (MB) is allowed on top of the memory already mapped by
+    the process (e.g. inherited from its parent).
+    """
+    if not memory_limit:
+        return
+    try:
+        with open("/proc/self/statm") as statm:
+            vm_size = int(statm.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        # Unable to get the current memory usage (non-Linux system)
+        return
+    limit = vm_size + memory_limit * 1024**2
+    # Only the soft limit is set, so processes started by this one can
+    # get their own limit
+    __, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    if hard_limit != resource.RLIM_INFINITY:
+        limit = min(limit, hard_limit)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard_limit))
+
+
+def limit_cpu_time(cpu_time_limit):
+    """Bound the CPU time (seconds) the current process can use.
+
+    The process is killed by a SIGXCPU signal once the limit is reached.
+    """
+    if not cpu_time_limit:
+        return
+    __, hard_limit = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_time_limit, hard_limit))
+
+
+def run_scan(scanner, memory_limit=0, cpu_time_limit=0):
+    """Run `scanner.scan()` in a child process and return its result.
+
+    `memory_limit` (MB) and `cpu_time_limit` (seconds) bound the resources
+    of the child process (0 for no limit). Exceptions raised by the hooks
+    are raised as is (the child process being killed), failures of the
+    child process raise a `ScannerProcessError`.
+    """
+    context = multiprocessing.get_context("fork")
+    conn, child_conn = context.Pipe()
+    # NOTE: a daemon process cannot start the pool of processes analyzing
+    # modules, so the child process is stopped explicitly in any case
+    process = context.Process(
+        target=_run_child,
+        args=(scanner, child_conn, memory_limit, cpu_time_limit),
+        name=f"scanner {scanner.full_name}",
+    )
+    process.start()
+    child_conn.close()
+    _logger.info("%s: scan in process %s", scanner.full_name, process.pid)
+    try:
+        while True:
+            if not conn.poll(POLL_INTERVAL):
+                if not process.is_alive():
+                    break
+                continue
+            try:
+                message, *args = conn.recv()
+            except EOFError:
+                break
+            if message == "hook":
+                hook, hook_args = args
+                res = getattr(scanner, hook)(*hook_args)
+                try:
+                    conn.send(res)
+                except (TypeError, AttributeError, pickle.PicklingError) as exc:
+                    raise ScannerProcessError(
+                        f"{scanner.full_name}: result of {hook} cannot be sent "
+                        f"to the scanner process: {exc}"
+                    ) from exc
+            elif message == "result":
+                process.join()
+                return args[0]
+            elif message == "error":
+                raise ScannerProcessError(
+                    f"{scanner.full_name}: scanner failed:\n{args[0]}"
+                )
+        process.join()
+        raise ScannerProcessError(
+            f"{scanner.full_name}: scanner process stopped "
+            f"(exit code {process.exitcode})"
+        )
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        conn.close()
+
+
+def _run_child(scanner, conn, memory_limit, cpu_time_limit):
+    limit_memory(memory_limit)
+    limit_cpu_time(cpu_time_limit)
+    for hook in scanner._hooks:
+        setattr(scanner, hook, functools.partial(_call_parent, conn, hook))
+    try:
+        res = scanner.scan()
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    else:
+        conn.send(("result", res))
+    finally:
+        conn.close()
+
+
+def _call_parent(conn, hook, *args):
+    conn.send(("hook", hook, args))
+    return conn.recv()
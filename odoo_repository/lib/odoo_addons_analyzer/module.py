@@ -2,10 +2,29 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
 
 import ast
+import io
 import os
 import pathlib
 
 import pygount
+import pygount.analysis
+
+from . import sloc
+
+# Byte order marks identifying text files (see 'pygount.analysis')
+TEXT_BOMS = (
+    b"\xef\xbb\xbf",
+    b"\xff\xfe\x00\x00",
+    b"\x00\x00\xfe\xff",
+    b"\xff\xfe",
+    b"\xfe\xff",
+)
+# SHA of the empty blob
+EMPTY_BLOB_SHA = "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+# Number of bytes read to detect binary files
+BINARY_SNIFF_SIZE = 8192
+# Tools available to count SLOC
+SLOC_BACKENDS = ("builtin", "pygount")
 
 
 class ModuleAnalysis:
@@ -14,11 +33,35 @@ class ModuleAnalysis:
         folder_path,
         languages=("Python", "XML", "CSS", "JavaScript"),
         repo_analysis=None,
+        tree=None,
+        blob_cache=None,
+        fetch_blobs=None,
+        sloc_backend="builtin",
     ):
+        """Analyze the Odoo module located in `folder_path`.
+
+        If `tree` is set (`git.Tree` object of the module), files are read
+        from the Git object database instead of the filesystem, so no
+        working tree (checkout) is required.
+
+        In this mode, `blob_cache` can provide the SLOC already counted for
+        the module files (see `AnalysisCache.get_blobs_sloc`), so only
+        files with a new content (blob) are counted.
+        `fetch_blobs` is called with the list of blobs before reading them,
+        allowing to download them in one go from a partial clone.
+
+        `sloc_backend` is the tool counting SLOC: 'builtin' (see the `sloc`
+        module, pygount being used for files it cannot parse) or 'pygount'.
+        """
         self.folder_path = folder_path
         self.languages = languages
         self.repo_analysis = repo_analysis
-        self.summary = pygount.ProjectSummary()
+        self.tree = tree
+        self.blob_cache = blob_cache
+        self.fetch_blobs = fetch_blobs
+        self.sloc_backend = sloc_backend
+        # SLOC of each file: {file_path: (language, code_count)}
+        self.files_sloc = {}
         self._run()
 
     @property
@@ -27,6 +70,8 @@ class ModuleAnalysis:
 
     @property
     def file_paths(self):
+        if self.tree is not None:
+            return [blob.path for blob in self._get_blobs()]
         return [
             os.path.join(dirpath, f)
             for (dirpath, dirnames, filenames) in os.walk(self.folder_path)
@@ -36,31 +81,149 @@ class ModuleAnalysis:
     @property
     def manifest(self):
         for manifest_name in ("__openerp__.py", "__manifest__.py"):
-            manifest_path = pathlib.Path(self.folder_path, manifest_name)
-            if manifest_path.exists():
-                with open(manifest_path) as file_:
-                    try:
-                        manifest = ast.literal_eval(file_.read())
-                    except ValueError:
-                        return {}
-                    return manifest
+            content = self._read_manifest(manifest_name)
+            if content is not None:
+                try:
+                    manifest = ast.literal_eval(content)
+                except ValueError:
+                    return {}
+                return manifest
         return {}
 
+    def _read_manifest(self, manifest_name):
+        """Return the content of `manifest_name`, or `None` if it doesn't exist."""
+        if self.tree is not None:
+            try:
+                blob = self.tree / manifest_name
+            except KeyError:
+                return None
+            return blob.data_stream.read().decode()
+        manifest_path = pathlib.Path(self.folder_path, manifest_name)
+        if manifest_path.exists():
+            with open(manifest_path) as file_:
+                return file_.read()
+        return None
+
+    def _get_blobs(self):
+        """Return the files (`git.Blob` objects) of the module tree."""
+        return [
+            item
+            for item in self.tree.traverse()
+            # Skip sub-modules and symbolic links
+            if item.type == "blob" and item.mode != item.link_mode
+        ]
+
     def _run(self):
+        if self.tree is not None:
+            return self._run_from_tree()
         for file_path in self.file_paths:
-            source_analysis = pygount.SourceAnalysis.from_file(
-                file_path,
-                group=os.path.basename(self.folder_path),
-                encoding="utf-8",
+            if self.sloc_backend == "pygount":
+                source_analysis = pygount.SourceAnalysis.from_file(
+                    file_path,
+                    group=os.path.basename(self.folder_path),
+                    encoding="utf-8",
+                )
+                self.files_sloc[file_path] = (
+                    source_analysis.language,
+                    source_analysis.code_count,
+                )
+                continue
+            if not self._is_analyzable(file_path):
+                continue
+            with open(file_path, "rb") as file_:
+                content = file_.read(BINARY_SNIFF_SIZE)
+                if self._is_binary(content):
+                    self.files_sloc[file_path] = ("__binary__", 0)
+                    continue
+                content += file_.read()
+            self.files_sloc[file_path] = self._count_sloc(file_path, content)
+
+    def _run_from_tree(self):
+        # NOTE: identical files share the same key, so they are counted
+        # once but reported for each path
+        blobs = [
+            (self._get_blob_key(blob), blob)
+            for blob in self._get_blobs()
+            # Perform the same checks than pygount does on files before
+            # reading them, as these are skipped when a file handle is given.
+            # NOTE: blob size is not used as it could trigger the download
+            # of the blob in a partial clone.
+            if blob.hexsha != EMPTY_BLOB_SHA and self._is_analyzable(blob.path)
+        ]
+        blobs_sloc = {}
+        if self.blob_cache is not None:
+            blobs_sloc = self.blob_cache.get_blobs_sloc(
+                list({key for key, __ in blobs})
             )
-            self.summary.add(source_analysis)
+        if self.fetch_blobs is not None:
+            blobs_to_read = [blob for key, blob in blobs if key not in blobs_sloc]
+            for manifest_name in ("__openerp__.py", "__manifest__.py"):
+                try:
+                    blobs_to_read.append(self.tree / manifest_name)
+                except KeyError:
+                    continue
+            self.fetch_blobs(blobs_to_read)
+        new_blobs_sloc = {}
+        for key, blob in blobs:
+            if key not in blobs_sloc and key not in new_blobs_sloc:
+                new_blobs_sloc[key] = self._count_blob_sloc(blob)
+        if self.blob_cache is not None and new_blobs_sloc:
+            self.blob_cache.set_blobs_sloc(new_blobs_sloc)
+        blobs_sloc.update(new_blobs_sloc)
+        for key, blob in blobs:
+            self.files_sloc[blob.path] = tuple(blobs_sloc[key])
+
+    def _is_analyzable(self, file_path):
+        """Check if the SLOC of `file_path` can be counted."""
+        if self.sloc_backend == "pygount":
+            return pygount.analysis.has_lexer(file_path)
+        # Only files of the reported languages are counted
+        return sloc.get_language(file_path) in self.languages
+
+    def _get_blob_key(self, blob):
+        """Return the key identifying the SLOC of `blob`.
+
+        The language of a file depends on its content and on its name
+        (extension), so both are part of the key, as well as the tool
+        counting SLOC.
+        """
+        name = os.path.basename(blob.path)
+        return f"{blob.hexsha}:{os.path.splitext(name)[1] or name}:{self.sloc_backend}"
+
+    def _count_blob_sloc(self, blob):
+        """Return the language and the SLOC of `blob`."""
+        content = blob.data_stream.read()
+        if self._is_binary(content):
+            return ("__binary__", 0)
+        return self._count_sloc(blob.path, content)
+
+    def _count_sloc(self, file_path, content):
+        """Return the language and the SLOC of `file_path`."""
+        if self.sloc_backend == "builtin":
+            res = sloc.count_sloc(file_path, content)
+            if res is not None:
+                return res
+        source_analysis = pygount.SourceAnalysis.from_file(
+            file_path,
+            group=self.name,
+            encoding="utf-8",
+            file_handle=io.BytesIO(content),
+        )
+        return (source_analysis.language, source_analysis.code_count)
+
+    def _is_binary(self, content):
+        initial_bytes = content[:BINARY_SNIFF_SIZE]
+        return (
+            not any(initial_bytes.startswith(bom) for bom in TEXT_BOMS)
+            and b"\0" in initial_bytes
+        )
 
     def to_dict(self):
         summaries = dict.fromkeys(self.languages, 0)
         data = {"code": summaries, "manifest": self.manifest}
-        for summary in self.summary.language_to_language_summary_map.values():
+        for file_language, code_count in self.files_sloc.values():
             for language in self.languages:
-                if not summary.language.startswith(language):
+                if not file_language.startswith(language):
                     continue
-                summaries[language] += summary.code_count
+                summaries[language] += code_count
         return data
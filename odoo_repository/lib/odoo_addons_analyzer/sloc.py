@@ -0,0 +1,217 @@
+# Copyright 2023 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
+"""Count the source lines of code (SLOC) of Odoo module files.
+
+This is a lightweight alternative to pygount for the languages reported by
+the module analysis. Lines are classified the same way: a line is code if it
+contains something else than blanks, comments, strings or the punctuation
+characters `(),:;[]{}`.
+"""
+
+import io
+import os
+import re
+import tokenize
+
+# Supported languages by file extension
+LANGUAGES = {
+    ".py": "Python",
+    ".xml": "XML",
+    ".js": "JavaScript",
+    ".css": "CSS",
+}
+# Characters that are not code when alone on a line (see 'pygount.analysis')
+WHITE_CHARACTERS = " \f\n\r\t(),:;[]{}"
+# Patterns identifying generated files in their first lines (see pygount)
+GENERATED_REGEX = re.compile(
+    r"(?i).*(autogenerated|automatically generated|do not edit"
+    r"|generated with the .+ utility|this is a generated file"
+    r"|generated automatically)"
+)
+GENERATED_MAX_LINES = 15
+
+_STRING_PATTERNS = [
+    r"'(?:\\.|[^'\\\n])*'",
+    r'"(?:\\.|[^"\\\n])*"',
+]
+_C_COMMENT_PATTERNS = [
+    r"/\*.*?(?:\*/|\Z)",
+]
+_CSS_REGEX = re.compile(
+    "|".join(
+        f"(?P<{group}>{pattern})"
+        for group, pattern in (
+            ("comment", "|".join(_C_COMMENT_PATTERNS)),
+            ("string", "|".join(_STRING_PATTERNS)),
+        )
+    ),
+    re.DOTALL,
+)
+_JS_REGEX = re.compile(
+    "|".join(
+        f"(?P<{group}>{pattern})"
+        for group, pattern in (
+            ("comment", "|".join([r"//[^\n]*"] + _C_COMMENT_PATTERNS)),
+            ("string", "|".join(_STRING_PATTERNS)),
+            ("template", r"`(?:\\.|[^`\\])*(?:`|\Z)"),
+            ("regex", r"/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n])+/[a-zA-Z]*"),
+        )
+    ),
+    re.DOTALL,
+)
+# Characters or keywords after which a slash starts a regular expression
+_JS_REGEX_PRECEDING_CHARS = "(,=:[!&|?{};+-*%<>~^"
+_JS_REGEX_PRECEDING_WORD = re.compile(
+    r"\b(?:return|typeof|instanceof|in|of|new|delete|void|throw|case|do|else"
+    r"|yield|await)\s*$"
+)
+_XML_REGEX = re.compile(
+    r"(?P<comment><!--.*?(?:-->|\Z))"
+    r"|(?P<code><!\[CDATA\[.*?\]\]>|<\?.*?\?>|<![^>]*>)"
+    r"|(?P<tag><\s*[\w:.-]+(?:[^>\"']|\"[^\"]*\"|'[^']*')*>?)",
+    re.DOTALL,
+)
+_XML_ATTRIBUTE_VALUE_REGEX = re.compile(r"\"[^\"]*\"|'[^']*'")
+_PYTHON_INTERPOLATION_REGEX = re.compile(r"(?<!\{)\{(?!\{)")
+
+
+def get_language(path):
+    """Return the language of the file `path`, or `None` if not supported."""
+    return LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+
+def count_sloc(path, content):
+    """Return the language and the SLOC of the file `path`.
+
+    `content` is the content of the file (bytes). It returns `None` if the
+    file cannot be analyzed by this module (unsupported language or syntax
+    error), so another tool could be used.
+    """
+    language = get_language(path)
+    if language is None:
+        return None
+    try:
+        text = content.decode("utf-8")
+    except UnicodeError:
+        return ("__error__", 0)
+    text = text.lstrip("\ufeff")
+    if _is_generated(text):
+        return ("__generated__", 0)
+    count = _COUNTERS[language](text)
+    if count is None:
+        return None
+    return (language, count)
+
+
+def _is_generated(text):
+    lines = text.split("\n", GENERATED_MAX_LINES)[:GENERATED_MAX_LINES]
+    return any(GENERATED_REGEX.match(line) for line in lines)
+
+
+def _count_code_lines(text):
+    """Count the lines of `text` containing code."""
+    return sum(1 for line in text.split("\n") if line.strip(WHITE_CHARACTERS))
+
+
+def _newlines(text):
+    return "\n" * text.count("\n")
+
+
+def _count_python(text):
+    code_lines = set()
+    # Lines ending in a comment or a multiline string
+    other_lines = set()
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            type_, string, (start_row, __), (end_row, __), __ = token
+            if type_ == tokenize.COMMENT:
+                other_lines.add(start_row)
+            elif type_ == tokenize.STRING:
+                other_lines.update(range(start_row, end_row))
+            if type_ in (tokenize.NAME, tokenize.NUMBER):
+                # 'pass' alone on a line is not considered as code
+                if string != "pass":
+                    code_lines.add(start_row)
+            elif type_ in (tokenize.OP, tokenize.ERRORTOKEN):
+                if string.strip(WHITE_CHARACTERS):
+                    code_lines.add(start_row)
+            elif type_ == tokenize.STRING:
+                # Interpolated expressions of f-strings are code
+                prefix = string[: string.find(string[-1])].lower()
+                if "f" not in prefix:
+                    continue
+                for row, line in enumerate(string.split("\n"), start=start_row):
+                    if _PYTHON_INTERPOLATION_REGEX.search(line):
+                        code_lines.add(row)
+    except (SyntaxError, tokenize.TokenError):
+        return None
+    # Explicit line joining (backslash) is code
+    for row, line in enumerate(text.split("\n"), start=1):
+        if line.rstrip().endswith("\\") and row not in other_lines:
+            code_lines.add(row)
+    return len(code_lines)
+
+
+def _count_css(text):
+    return _count_code_lines(
+        _CSS_REGEX.sub(lambda match: _newlines(match.group()), text)
+    )
+
+
+def _count_javascript(text):
+    parts = []
+    code_start = pos = 0
+    while True:
+        match = _JS_REGEX.search(text, pos)
+        if match is None:
+            break
+        if match.lastgroup == "regex" and not _is_js_regex_allowed(
+            text[max(match.start() - 100, 0) : match.start()]
+        ):
+            # Division operator
+            pos = match.start() + 1
+            continue
+        parts.append(text[code_start : match.start()])
+        if match.lastgroup == "template":
+            # Interpolated expressions of template literals are code
+            parts.append(
+                "\n".join(
+                    "x" if "${" in line else "" for line in match.group().split("\n")
+                )
+            )
+        else:
+            parts.append(_newlines(match.group()))
+        code_start = pos = match.end()
+    parts.append(text[code_start:])
+    return _count_code_lines("".join(parts))
+
+
+def _is_js_regex_allowed(preceding_text):
+    """Check if a slash following `preceding_text` starts a regex."""
+    stripped_text = preceding_text.rstrip()
+    if not stripped_text:
+        return True
+    if stripped_text[-1] in _JS_REGEX_PRECEDING_CHARS:
+        return True
+    return bool(_JS_REGEX_PRECEDING_WORD.search(stripped_text[-20:]))
+
+
+def _count_xml(text):
+    def mask(match):
+        if match.lastgroup == "comment":
+            return _newlines(match.group())
+        if match.lastgroup == "tag":
+            return _XML_ATTRIBUTE_VALUE_REGEX.sub(
+                lambda value: _newlines(value.group()), match.group()
+            )
+        return match.group()
+
+    return _count_code_lines(_XML_REGEX.sub(mask, text))
+
+
+_COUNTERS = {
+    "Python": _count_python,
+    "XML": _count_xml,
+    "JavaScript": _count_javascript,
+    "CSS": _count_css,
+}
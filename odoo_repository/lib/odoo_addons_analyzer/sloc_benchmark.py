@@ -0,0 +1,105 @@
+# Copyright 2023 Camptocamp SA
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
+"""Compare the built-in SLOC counter with pygount on Odoo modules.
+
+Usage (from the `lib` folder):
+
+    python -m odoo_addons_analyzer.sloc_benchmark PATH [PATH ...]
+
+Each `PATH` is an addons folder (e.g. a clone of an OCA repository) or a
+module. Files of the reported languages are counted with both tools, the
+files for which they differ are listed and the time spent by each of them
+is reported. The exit status is 1 if the counts differ.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import pygount
+
+from . import sloc
+
+
+def _get_file_paths(paths):
+    for path in paths:
+        for dirpath, __, filenames in os.walk(path):
+            for filename in sorted(filenames):
+                file_path = os.path.join(dirpath, filename)
+                if sloc.get_language(file_path) and not os.path.islink(file_path):
+                    yield file_path
+
+
+def _count_with_pygount(file_path, content):
+    source_analysis = pygount.SourceAnalysis.from_file(
+        file_path,
+        group="benchmark",
+        encoding="utf-8",
+        file_handle=io.BytesIO(content),
+    )
+    return (source_analysis.language, source_analysis.code_count)
+
+
+def run(paths, verbose=False):
+    """Count SLOC of files under `paths` with both tools.
+
+    It returns the statistics as a dictionary.
+    """
+    stats = {
+        "files": 0,
+        "mismatches": [],
+        "unsupported": 0,
+        "time": {"builtin": 0.0, "pygount": 0.0},
+        "code": {},
+    }
+    for file_path in _get_file_paths(paths):
+        with open(file_path, "rb") as file_:
+            content = file_.read()
+        stats["files"] += 1
+        start = time.perf_counter()
+        builtin_res = sloc.count_sloc(file_path, content)
+        stats["time"]["builtin"] += time.perf_counter() - start
+        start = time.perf_counter()
+        pygount_res = _count_with_pygount(file_path, content)
+        stats["time"]["pygount"] += time.perf_counter() - start
+        language = sloc.get_language(file_path)
+        code = stats["code"].setdefault(language, {"builtin": 0, "pygount": 0})
+        if pygount_res[0].startswith(language):
+            code["pygount"] += pygount_res[1]
+        if builtin_res is None:
+            # Not parsable, pygount would be used as fallback
+            stats["unsupported"] += 1
+            builtin_res = pygount_res
+        if builtin_res[0] == language:
+            code["builtin"] += builtin_res[1]
+        if builtin_res[1] != pygount_res[1]:
+            stats["mismatches"].append((file_path, builtin_res, pygount_res))
+            if verbose:
+                print(f"{file_path}: builtin={builtin_res} pygount={pygount_res}")
+    return stats
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+", help="Addons folders or modules")
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="List files counted differently"
+    )
+    args = parser.parse_args(args)
+    stats = run(args.paths, verbose=args.verbose)
+    print(f"Files: {stats['files']} (parsed by pygount: {stats['unsupported']})")
+    for language, code in sorted(stats["code"].items()):
+        print(f"{language}: builtin={code['builtin']} pygount={code['pygount']}")
+    print(f"Files counted differently: {len(stats['mismatches'])}")
+    builtin_time, pygount_time = stats["time"]["builtin"], stats["time"]["pygount"]
+    print(
+        f"Time: builtin={builtin_time:.2f}s pygount={pygount_time:.2f}s "
+        f"(x{pygount_time / (builtin_time or 1e-9):.1f})"
+    )
+    return 1 if stats["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
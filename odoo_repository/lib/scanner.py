@@ -2,17 +2,27 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl)
 
 import contextlib
+import fcntl
+import functools
 import json
 import logging
+import multiprocessing
 import os
 import pathlib
+import shlex
+import shutil
+import stat
 import subprocess
 import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import git
 import oca_port
 
+from . import bundles, isolation
+from .cache import AnalysisCache
+from .git_backends import get_backend
 from .odoo_addons_analyzer import ModuleAnalysis
 
 # Disable logging from 'pygount' (used by odoo_addons_analyzer)
@@ -21,8 +31,106 @@ logging.getLogger("pygount").setLevel(logging.ERROR)
 _logger = logging.getLogger(__name__)
 
 
+def fetch_missing_blobs(repo, tree, blobs, git_env=None):
+    """Download `blobs` of `tree` missing from the partial clone `repo`.
+
+    All the missing blobs are fetched with one request. It returns the number
+    of fetched blobs.
+    """
+    missing_shas = {
+        line[1:]
+        for line in repo.git.rev_list(
+            "--objects", "--missing=print", tree.hexsha
+        ).splitlines()
+        if line.startswith("?")
+    }
+    shas = sorted({blob.hexsha for blob in blobs} & missing_shas)
+    if not shas:
+        return 0
+    subprocess.run(
+        [
+            "git",
+            "-c",
+            "fetch.negotiationAlgorithm=noop",
+            "fetch",
+            "origin",
+            "--no-tags",
+            "--no-write-fetch-head",
+            "--recurse-submodules=no",
+            "--filter=blob:none",
+            "--stdin",
+        ],
+        cwd=repo.git_dir,
+        env=dict(os.environ, **(git_env or {})),
+        input="\n".join(shas),
+        text=True,
+        capture_output=True,
+        check=True,
+    )
+    return len(shas)
+
+
+# Repository opened by a process analyzing modules
+_worker_repo = None
+
+
+def _init_analysis_worker(repo_path, memory_limit):
+    """Initialize a process analyzing modules.
+
+    The repository is opened once for all the modules analyzed by the
+    process, and the memory the process can allocate is bounded to
+    `memory_limit` MB on top of what it inherited from its parent.
+    """
+    global _worker_repo
+    # NOTE: the 'git.Repo' object of the parent process must not be used,
+    # as it would share its 'git cat-file' processes
+    _worker_repo = git.Repo(repo_path)
+    isolation.limit_memory(memory_limit)
+
+
+def _analyze_module(
+    commit,
+    module_path,
+    cache_path=None,
+    cache_size=None,
+    git_env=None,
+    sloc_backend="builtin",
+):
+    """Analyze `module_path` as of `commit` in a separate process.
+
+    If `git_env` is set, the repository is a partial clone and missing blobs
+    are downloaded before being read.
+    """
+    tree = _worker_repo.commit(commit).tree / module_path
+    blob_cache = None
+    if cache_path:
+        blob_cache = AnalysisCache(cache_path, max_entries=cache_size)
+    fetch_blobs = None
+    if git_env is not None:
+        fetch_blobs = functools.partial(
+            fetch_missing_blobs, _worker_repo, tree, git_env=git_env
+        )
+    module_analysis = ModuleAnalysis(
+        module_path,
+        tree=tree,
+        blob_cache=blob_cache,
+        fetch_blobs=fetch_blobs,
+        sloc_backend=sloc_backend,
+    )
+    return module_analysis.to_dict()
+
+
 class BaseScanner:
     _dirname = "odoo-repositories"
+    # Folder of `repositories_path` hosting the shared object stores
+    _object_stores_dirname = ".objects"
+    # Seconds the shared SSH connection stays open once unused
+    _ssh_control_persist = 60
+    _manifest_files = ("__manifest__.py", "__openerp__.py")
+    # Methods exchanging data with Odoo, run by the calling process when the
+    # scanner runs in a child process (see `isolation`): their arguments and
+    # results have to be plain data (IDs, strings, lists, dicts...)
+    _hooks = ()
 
     def __init__(
         self,
@@ -33,6 +141,10 @@ class BaseScanner:
         repositories_path: str = None,
         ssh_key: str = None,
         github_token: str = None,
+        partial_clone: bool = False,
+        git_backend: str = "gitpython",
+        object_store: str = None,
+        bundles_path: str = None,
     ):
         self.org = org
         self.name = name
@@ -43,34 +155,169 @@ class BaseScanner:
         self._apply_git_config()
         self.ssh_key = ssh_key
         self.github_token = github_token
+        # Partial clone: blobs are downloaded only when they are read
+        self.partial_clone = partial_clone
+        # Implementation of Git operations (see `git_backends`)
+        self.git_backend = git_backend
+        # Name of the object store shared with related repositories (forks)
+        self.object_store = object_store
+        # Folder hosting Git bundles to restore instead of cloning
+        # (see `bundles`)
+        self.bundles_path = bundles_path
+        # Git session (see `_git_session`)
+        self._session_depth = 0
+        self._session_repo = None
+        self._session_backend = None
+        self._session_stack = None
+        self._session_git_env = None
+        self._refs_cache = {}
+        self._commits_cache = {}
+        self._module_dirs_cache = {}
 
     def scan(self):
         # Clone or update the repository
-        if not self.is_cloned:
-            self._clone()
-        self._fetch()
+        with self._git_session(), self._lock():
+            if not self.is_cloned:
+                self._clone()
+            if self._fetch() or not self._has_commit_graph():
+                self._write_commit_graph()
+
+    def maintain(self):
+        """Clean up and optimize the local clone of the repository.
+
+        Remote-tracking refs of branches not scanned anymore are deleted,
+        then objects are repacked and those no longer reachable pruned.
+        Objects borrowed from a shared object store are left untouched.
+        Return `False` if the repository is not cloned.
+        """
+        with self._git_session(), self._lock():
+            if not self.is_cloned:
+                return False
+            self._prune_refs()
+            self._gc()
+            self._write_commit_graph()
+        return True
+
+    @contextlib.contextmanager
+    def _git_session(self):
+        """Share one opened repository between all operations of a scan.
+
+        Within a session `repo` always returns the same `git.Repo` object,
+        so Git objects are read by the same persistent `git cat-file --batch`
+        processes, `backend` the same Git backend, and resolved refs are cached
+        (see `_resolve_ref` and `_get_commit`).
+        These processes are stopped when leaving the outermost session.
+
+        For private repositories, one SSH connection is also shared by all
+        Git invocations of the session (see `_get_git_env`).
+        """
+        if not self._session_depth:
+            self._session_stack = contextlib.ExitStack()
+        self._session_depth += 1
+        try:
+            yield
+        finally:
+            self._session_depth -= 1
+            if not self._session_depth:
+                self._close_git_session()
+
+    def _close_git_session(self):
+        if self._session_stack is not None:
+            self._session_stack.close()
+            self._session_stack = None
+            self._session_git_env = None
+        if self._session_backend is not None:
+            self._session_backend.close()
+            self._session_backend = None
+        if self._session_repo is not None:
+            self._session_repo.close()
+            self._session_repo = None
+        self._clear_refs_cache()
+        self._module_dirs_cache.clear()
+
+    def _clear_refs_cache(self):
+        self._refs_cache.clear()
+        self._commits_cache.clear()
+
+    @contextlib.contextmanager
+    def _lock(self, lock_path=None):
+        """Lock the repository to prevent concurrent updates of its refs.
+
+        Several scanners could run on the same repository at the same time
+        (e.g. to scan different branches), but only one of them at once
+        can clone or fetch it.
+        """
+        if lock_path is None:
+            lock_path = self.path.parent.joinpath(f".{self.name}.lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
 
     @contextlib.contextmanager
     def _get_git_env(self):
-        """Context manager yielding env variables used by Git invocations."""
-        git_env = {}
-        if self.ssh_key:
-            with self._get_ssh_key() as ssh_key_path:
-                ssh_key_path = "/home/salix/.ssh/testing"  # FIXME test
-                git_ssh_cmd = f"ssh -o StrictHostKeyChecking=no -i {ssh_key_path}"
-                git_env.update(GIT_SSH_COMMAND=git_ssh_cmd, GIT_TRACE="true")
-                yield git_env
+        """Context manager yielding env variables used by Git invocations.
+
+        Within a Git session, the SSH session (key and connection) is opened
+        once and reused by all Git invocations until the end of the session.
+        """
+        if not self.ssh_key:
+            yield {}
+        elif self._session_depth:
+            if self._session_git_env is None:
+                self._session_git_env = self._session_stack.enter_context(
+                    self._ssh_session()
+                )
+            yield dict(self._session_git_env)
         else:
-            yield git_env
+            with self._ssh_session() as git_env:
+                yield git_env
 
     @contextlib.contextmanager
-    def _get_ssh_key(self):
-        """Save the SSH key in a temporary file and yield its path."""
-        with tempfile.NamedTemporaryFile() as fp:
-            fp.write(self.ssh_key.encode())
-            fp.flush()
-            ssh_key_path = fp.name
-            yield ssh_key_path
+    def _ssh_session(self):
+        """Yield env variables making Git share one SSH connection.
+
+        The SSH key is saved in a private temporary folder, along with the
+        socket of the master connection (multiplexing) reused by subsequent
+        connections. The master connection is closed on exit.
+        """
+        with tempfile.TemporaryDirectory(prefix="odoo-repository-ssh-") as tmp_dir:
+            ssh_key_path = os.path.join(tmp_dir, "id")
+            fd = os.open(ssh_key_path, os.O_WRONLY | os.O_CREAT, 0o600)
+            with open(fd, "w") as ssh_key_file:
+                ssh_key_file.write(self.ssh_key.strip() + "\n")
+            control_path = os.path.join(tmp_dir, "control")
+            ssh_options = [
+                "StrictHostKeyChecking=no",
+                "IdentitiesOnly=yes",
+                "ControlMaster=auto",
+                f"ControlPath={control_path}",
+                # Stop the master connection if it is not closed on exit
+                f"ControlPersist={self._ssh_control_persist}",
+            ]
+            git_ssh_cmd = " ".join(
+                ["ssh", "-i", shlex.quote(ssh_key_path)]
+                + [f"-o {shlex.quote(ssh_option)}" for ssh_option in ssh_options]
+            )
+            try:
+                yield {"GIT_SSH_COMMAND": git_ssh_cmd}
+            finally:
+                if os.path.exists(control_path):
+                    subprocess.run(
+                        [
+                            "ssh",
+                            "-o",
+                            f"ControlPath={control_path}",
+                            "-O",
+                            "exit",
+                            "localhost",
+                        ],
+                        capture_output=True,
+                        check=False,
+                    )
 
     def _prepare_repositories_path(self, repositories_path=None):
         if not repositories_path:
@@ -98,66 +345,485 @@ class BaseScanner:
 
     @property
     def repo(self):
-        return git.Repo(self.path)
+        if not self._session_depth:
+            return git.Repo(self.path)
+        if self._session_repo is None:
+            self._session_repo = git.Repo(self.path)
+        return self._session_repo
+
+    @property
+    def backend(self):
+        """Return the Git backend used to query the repository."""
+        if not self._session_depth:
+            return get_backend(self.git_backend, self.path)
+        if self._session_backend is None:
+            self._session_backend = get_backend(
+                self.git_backend, self.path, repo=self.repo
+            )
+        return self._session_backend
+
+    def _resolve_ref(self, ref):
+        """Return the SHA of the commit `ref` points to, or `None`.
+
+        Within a Git session, resolved refs are cached until the next fetch.
+        """
+        if ref not in self._refs_cache:
+            commit = self.backend.resolve(ref)
+            if not self._session_depth:
+                return commit
+            self._refs_cache[ref] = commit
+        return self._refs_cache[ref]
+
+    def _get_commit(self, ref):
+        """Return the `git.Commit` object of `ref` (ref name or SHA).
+
+        Within a Git session, resolved refs are cached until the next fetch.
+        """
+        commit = self._commits_cache.get(ref)
+        if commit is None:
+            commit = self.repo.commit(ref)
+            if self._session_depth:
+                self._commits_cache[ref] = commit
+        return commit
 
     @property
     def full_name(self):
         return f"{self.org}/{self.name}"
 
+    @property
+    def is_partial_clone(self):
+        return self.repo.config_reader().has_option('remote "origin"', "promisor")
+
+    @property
+    def object_store_path(self):
+        """Return the path of the object store shared with related repositories.
+
+        Partial clones do not use it, as they already download only the
+        objects they need.
+        """
+        if not self.object_store or self.partial_clone:
+            return None
+        return self.repositories_path.joinpath(
+            self._object_stores_dirname, f"{self.object_store}.git"
+        )
+
+    def _update_object_store(self):
+        """Fetch the objects of the repository in its shared object store.
+
+        The object store is a bare repository keeping the objects of related
+        repositories (e.g. forks of the same project) once, under a namespace
+        of refs per repository. Clones borrow its objects through
+        `objects/info/alternates` instead of storing their own copy.
+
+        To ensure that pruning objects never corrupts the clones borrowing
+        them, the store is flagged with `extensions.preciousObjects`: Git
+        refuses to delete any of its objects (`git gc` and `git repack`
+        only pack them). Clones remain safe to prune or delete as they
+        share nothing.
+
+        Return `True` if the store can be used by the clone.
+        """
+        store_path = self.object_store_path
+        lock_path = store_path.parent.joinpath(f".{store_path.name}.lock")
+        with self._lock(lock_path):
+            if not store_path.exists():
+                self._init_object_store()
+            elif not self._check_object_store():
+                _logger.warning(
+                    "%s: object store %s is not safe to share, ignored",
+                    self.full_name,
+                    store_path,
+                )
+                return False
+            _logger.info(
+                "%s: fetch objects in store %s", self.full_name, self.object_store
+            )
+            refspec = f"+refs/heads/*:{self._get_object_store_ref_prefix()}/*"
+            store = git.Repo(store_path)
+            try:
+                with self._get_git_env() as git_env:
+                    store.git.fetch("--no-tags", self.clone_url, refspec, env=git_env)
+            except git.exc.GitCommandError as exc:
+                _logger.warning(
+                    "%s: unable to fetch objects in store %s: %s",
+                    self.full_name,
+                    self.object_store,
+                    exc,
+                )
+                return False
+            finally:
+                store.close()
+        return True
+
+    def _get_object_store_ref_prefix(self, org=None, name=None):
+        return f"refs/repositories/{org or self.org}/{name or self.name}/heads"
+
+    def _init_object_store(self):
+        """Create the shared object store, seeded with existing local clones.
+
+        Objects of related repositories already cloned are copied locally,
+        so only the objects specific to the repository are downloaded.
+        """
+        store_path = self.object_store_path
+        _logger.info("Create object store %s", store_path)
+        tmp_path = store_path.with_name(f".{store_path.name}.tmp")
+        store = git.Repo.init(tmp_path, bare=True)
+        try:
+            with store.config_writer() as config:
+                # Objects of the store are never deleted
+                config.set_value("core", "repositoryformatversion", 1)
+                config.set_value("extensions", "preciousObjects", "true")
+            for clone_path in self._get_related_clone_paths():
+                org, name = clone_path.parent.name, clone_path.name
+                refspec = (
+                    "+refs/remotes/origin/*:"
+                    f"{self._get_object_store_ref_prefix(org, name)}/*"
+                )
+                try:
+                    store.git.fetch(
+                        "--no-tags",
+                        str(clone_path),
+                        refspec,
+                        "^refs/remotes/origin/HEAD",
+                    )
+                except git.exc.GitCommandError as exc:
+                    _logger.warning("Unable to seed object store: %s", exc)
+        finally:
+            store.close()
+        # Make the store available once initialized
+        tmp_path.rename(store_path)
+
+    def _get_related_clone_paths(self):
+        """Return the paths of the existing clones related to the repository.
+
+        Related repositories share the same name (forks) or the name of the
+        object store. Partial clones are excluded as they miss objects.
+        """
+        names = {self.name, self.object_store}
+        res = []
+        for name in sorted(names):
+            for git_dir in sorted(self.repositories_path.glob(f"*/{name}/.git")):
+                clone_path = git_dir.parent
+                if clone_path == self.path:
+                    continue
+                repo = git.Repo(clone_path)
+                try:
+                    if repo.config_reader().has_option('remote "origin"', "promisor"):
+                        continue
+                finally:
+                    repo.close()
+                res.append(clone_path)
+        return res
+
+    def _check_object_store(self):
+        """Check that the object store is safe to share with other clones."""
+        try:
+            store = git.Repo(self.object_store_path)
+        except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+            return False
+        try:
+            precious_objects = store.git.config(
+                "--get", "--bool", "--default=false", "extensions.preciousObjects"
+            )
+            return store.bare and precious_objects == "true"
+        finally:
+            store.close()
+
     def _clone(self):
+        if self._restore_bundle():
+            return
         _logger.info("Cloning %s...", self.full_name)
+        # There is no need to checkout a working tree as modules are analyzed
+        # from the Git objects (and so is the migration data by oca-port)
+        multi_options = ["--no-checkout"]
+        if self.partial_clone:
+            # Clone only commits and trees, blobs are fetched on demand
+            multi_options.append("--filter=blob:none")
+        if self.object_store_path and self._update_object_store():
+            # Borrow the objects of the shared store (nothing to download)
+            multi_options.append(f"--reference={self.object_store_path}")
         with self._get_git_env() as git_env:
-            git.Repo.clone_from(self.clone_url, self.path, env=git_env)
+            repo = git.Repo.clone_from(
+                self.clone_url, self.path, env=git_env, multi_options=multi_options
+            )
+        repo.close()
+
+    def _restore_bundle(self):
+        """Restore the clone from a Git bundle exported by another node.
+
+        Only the commits pushed since the export are then downloaded by the
+        next fetch. Partial clones and clones sharing an object store are
+        not restored from bundles, as bundles contain all the objects.
+        Return `True` if the clone has been restored.
+        """
+        if not self.bundles_path or self.partial_clone or self.object_store_path:
+            return False
+        try:
+            data = bundles.read_manifest(self.bundles_path).get(self.full_name)
+            if not data:
+                return False
+            _logger.info("Restoring %s from bundle...", self.full_name)
+            bundles.restore_bundle(
+                pathlib.Path(self.bundles_path, data["bundle"]),
+                self.path,
+                self.clone_url,
+                data,
+            )
+        except (git.exc.GitCommandError, ValueError) as exc:
+            _logger.warning(
+                "%s: unable to restore from bundle: %s", self.full_name, exc
+            )
+            return False
+        return True
 
     def _fetch(self):
-        repo = self.repo
+        """Fetch the branches that changed upstream in one round trip.
+
+        Remote heads are listed first and compared to the local ones, so
+        the fetch is skipped if nothing moved. It returns the list of
+        branches updated by the fetch.
+        """
+        remote_heads = self._get_remote_heads()
+        for branch in self.branches:
+            # Do not block the process if the branch doesn't exist on this repo
+            if branch not in remote_heads:
+                _logger.info(
+                    "%s: branch %s doesn't exist upstream", self.full_name, branch
+                )
+        local_heads = self._get_local_heads()
+        branches = [
+            branch
+            for branch, commit in remote_heads.items()
+            if local_heads.get(branch) != commit
+        ]
+        if not branches:
+            _logger.info("%s: no branch updated upstream", self.full_name)
+            return branches
+        _logger.info("%s: fetch branch(es) %s", self.full_name, ", ".join(branches))
+        # Also turn an existing full clone into a partial one
+        filter_ = "blob:none" if self.partial_clone else None
+        refspecs = [
+            f"+refs/heads/{branch}:refs/remotes/origin/{branch}" for branch in branches
+        ]
+        try:
+            with self._get_git_env() as git_env:
+                self.backend.fetch(refspecs, filter_=filter_, env=git_env)
+        except git.exc.GitCommandError as exc:
+            _logger.info(exc)
+            return []
+        # Refs moved
+        self._clear_refs_cache()
+        _logger.info("%s: branch(es) %s fetched", self.full_name, ", ".join(branches))
+        return branches
+
+    def _has_commit_graph(self):
+        objects_info_path = pathlib.Path(self.repo.git_dir, "objects", "info")
+        return (
+            objects_info_path.joinpath("commit-graph").exists()
+            or objects_info_path.joinpath(
+                "commit-graphs", "commit-graph-chain"
+            ).exists()
+        )
+
+    def _write_commit_graph(self):
+        """Write the commit-graph of the repository.
+
+        The commit-graph includes changed-path Bloom filters, allowing Git
+        to skip commits that didn't touch the paths of a path-limited log
+        (e.g. to get the last commit of modules) without reading their trees.
+        It is split in incremental layers so only new commits are written
+        after a fetch.
+        """
+        start = time.time()
+        try:
+            self.repo.git.commit_graph(
+                "write", "--reachable", "--changed-paths", "--split"
+            )
+        except git.exc.GitCommandError as exc:
+            _logger.warning(
+                "%s: unable to write the commit-graph: %s", self.full_name, exc
+            )
+            return False
+        _logger.info(
+            "%s: commit-graph written in %.2fs", self.full_name, time.time() - start
+        )
+        return True
+
+    def _prune_refs(self):
+        """Delete remote-tracking refs of branches not scanned anymore."""
+        refs = self.repo.git.for_each_ref(
+            "--format=%(refname)", "refs/remotes/origin/"
+        ).splitlines()
+        scanned_refs = {f"refs/remotes/origin/{branch}" for branch in self.branches}
+        stale_refs = [ref for ref in refs if ref not in scanned_refs]
+        if not stale_refs:
+            return
         _logger.info(
-            "%s: fetch branch(es) %s", self.full_name, ", ".join(self.branches)
+            "%s: delete stale ref(s) %s", self.full_name, ", ".join(stale_refs)
         )
+        for ref in stale_refs:
+            # 'origin/HEAD' is a symbolic ref, delete it instead of its target
+            self.repo.git.update_ref("-d", "--no-deref", ref)
+        self._clear_refs_cache()
+
+    def _gc(self):
+        """Repack the objects of the repository and prune unreachable ones."""
+        start = time.time()
+        try:
+            # The commit-graph is written by the scanner with its Bloom filters
+            self.repo.git(c="gc.writeCommitGraph=false").gc("--quiet")
+        except git.exc.GitCommandError as exc:
+            _logger.warning("%s: unable to gc: %s", self.full_name, exc)
+            return False
+        _logger.info("%s: gc done in %.2fs", self.full_name, time.time() - start)
+        return True
+
+    def _remove_clone(self):
+        """Delete the local clone of the repository to free disk space.
+
+        A shared object store is kept, as other clones could borrow its
+        objects.
+        """
+        with self._lock():
+            if self.is_cloned:
+                _logger.info("%s: remove clone %s", self.full_name, self.path)
+                shutil.rmtree(self.path)
+
+    def _get_remote_heads(self):
+        """Return the heads of the scanned branches in the remote repository.
+
+        It returns a dictionary `{branch: commit}`, branches that do not
+        exist in the remote repository being omitted.
+        """
+        patterns = [f"refs/heads/{branch}" for branch in self.branches]
+        with self._get_git_env() as git_env:
+            # Query the clone URL so it works even if the repository
+            # is not cloned yet
+            output = git.cmd.Git().ls_remote(
+                "--heads", self.clone_url, *patterns, env=git_env
+            )
+        heads = {}
+        for line in output.splitlines():
+            commit, ref = line.split("\t", 1)
+            if ref in patterns:
+                heads[ref.removeprefix("refs/heads/")] = commit
+        return heads
+
+    def _get_local_heads(self):
+        """Return the last fetched commits of the scanned branches.
+
+        It returns a dictionary `{branch: commit}`.
+        """
+        heads = {}
         for branch in self.branches:
-            # Do not block the process if the branch doesn't exist on this repo
-            try:
-                with self._get_git_env() as git_env:
-                    with repo.git.custom_environment(**git_env):
-                        repo.remotes.origin.fetch(branch)
-            except git.exc.GitCommandError as exc:
-                _logger.info(exc)
-            else:
-                _logger.info("%s: branch %s fetched", self.full_name, branch)
+            commit = self._resolve_ref(f"refs/remotes/origin/{branch}")
+            if commit:
+                heads[branch] = commit
+        return heads
+
+    def _fetch_missing_blobs(self, tree, blobs):
+        """Download `blobs` of `tree` missing from a partial clone.
+
+        All the missing blobs are fetched with one request, instead of
+        letting Git download them one by one when they are read.
+        """
+        with self._get_git_env() as git_env:
+            count = fetch_missing_blobs(self.repo, tree, blobs, git_env)
+        if count:
+            _logger.debug("%s: %s blob(s) fetched", self.full_name, count)
+
+    def _get_disk_usage(self):
+        """Return the disk space (in bytes) used by the repository.
+
+        Files removed while they are listed (e.g. temporary packs of a fetch
+        or a gc running in parallel) are ignored.
+        """
+        disk_usage = 0
+        # NOTE: unlike 'Path.rglob', 'os.walk' ignores folders removed while
+        # they are listed
+        for dir_path, __, file_names in os.walk(self.path):
+            for file_name in file_names:
+                try:
+                    file_stat = os.lstat(os.path.join(dir_path, file_name))
+                except OSError:
+                    continue
+                if stat.S_ISREG(file_stat.st_mode):
+                    disk_usage += file_stat.st_size
+        return disk_usage
 
     def _branch_exists(self, branch):
-        repo = self.repo
-        refs = [r.name for r in repo.remotes.origin.refs]
-        branch = f"origin/{branch}"
-        return branch in refs
+        return bool(self._resolve_ref(f"origin/{branch}"))
 
     def _checkout_branch(self, branch):
         self.repo.refs[f"origin/{branch}"].checkout()
 
     def _get_last_fetched_commit(self, branch):
         """Return the last fetched commit for the given `branch`."""
-        repo = self.repo
-        return repo.rev_parse(f"origin/{branch}").hexsha
+        return self._resolve_ref(f"origin/{branch}")
+
+    def _get_tree_path(self, relative_path):
+        """Clean up `relative_path` to make it compatible with `git.Tree` object.
+
+        E.g. './addons/' is converted to 'addons', and '.' to ''.
+        """
+        return "/".join(
+            [dir_ for dir_ in relative_path.split("/") if dir_ and dir_ != "."]
+        )
 
     def _get_module_paths(self, relative_path, branch):
         """Return modules available in `branch`.
 
         It returns a list of tuples `[(module, last_commit), ...]`.
         """
-        # Clean up 'relative_path' to make it compatible with 'git.Tree' object
-        relative_tree_path = "/".join(
-            [dir_ for dir_ in relative_path.split("/") if dir_ and dir_ != "."]
-        )
+        relative_tree_path = self._get_tree_path(relative_path)
         # No from_commit means first scan: return all available modules
-        branch_commit = self.repo.refs[f"origin/{branch}"].commit
-        addons_trees = branch_commit.tree.trees
-        if relative_tree_path:
-            addons_trees = (branch_commit.tree / relative_tree_path).trees
-        return [
-            (tree.path, self._get_commit_of_git_tree(f"origin/{branch}", tree))
-            for tree in addons_trees
-            if self._odoo_module(tree)
-        ]
+        branch_commit = self._get_last_fetched_commit(branch)
+        module_paths = sorted(
+            module_dir
+            for module_dir in self._get_module_dirs(branch_commit, relative_tree_path)
+            if module_dir.rpartition("/")[0] == relative_tree_path
+        )
+        commits = self._get_last_commits_of_paths(branch_commit, module_paths)
+        return [(module_path, commits[module_path]) for module_path in module_paths]
+
+    def _get_module_dirs(self, commit, tree_path=""):
+        """Return the folders hosting an Odoo module under `tree_path`.
+
+        Modules are found at any depth with one recursive listing of the
+        tree, instead of looking for a manifest in each folder.
+        Within a Git session, the result is cached for each commit.
+        """
+        key = (commit, tree_path)
+        if key not in self._module_dirs_cache:
+            module_dirs = set()
+            for file_path in self.backend.list_files(commit, tree_path):
+                dir_path, __, file_name = file_path.rpartition("/")
+                if dir_path and file_name in self._manifest_files:
+                    module_dirs.add(dir_path)
+            if not self._session_depth:
+                return module_dirs
+            self._module_dirs_cache[key] = module_dirs
+        return self._module_dirs_cache[key]
+
+    def _discover_addons_paths(self, branch):
+        """Return the addons paths hosting the modules of `branch`.
+
+        Modules are looked for at any depth of the repository. Modules
+        nested in another module (e.g. test data) are ignored.
+        It returns a sorted list of relative paths like '.' or './addons'.
+        """
+        commit = self._get_last_fetched_commit(branch)
+        module_dirs = self._get_module_dirs(commit)
+        tree_paths = set()
+        for module_dir in module_dirs:
+            parts = module_dir.split("/")
+            if any("/".join(parts[:i]) in module_dirs for i in range(1, len(parts))):
+                # Nested module
+                continue
+            tree_paths.add("/".join(parts[:-1]))
+        return sorted(
+            f"./{tree_path}" if tree_path else "." for tree_path in tree_paths
+        )
 
     def _get_module_paths_updated(
         self,
@@ -168,42 +834,91 @@ class BaseScanner:
     ):
         """Return modules updated between `from_commit` and `to_commit`.
 
-        It returns a list of tuples `[(module, last_commit), ...]`.
+        It returns a set of tuples `{(module, last_commit), ...}`.
         """
-        # Clean up 'relative_path' to make it compatible with 'git.Tree' object
-        relative_tree_path = "/".join(
-            [dir_ for dir_ in relative_path.split("/") if dir_ and dir_ != "."]
-        )
-        module_paths = set()
+        return self._get_module_paths_updated_by_addons_path(
+            [relative_path], from_commit, to_commit
+        )[relative_path]
+
+    def _get_module_paths_updated_by_addons_path(
+        self,
+        relative_paths,
+        from_commit,
+        to_commit,
+    ):
+        """Return modules updated between `from_commit` and `to_commit`.
+
+        The diff between both commits is computed once for all the addons
+        paths `relative_paths`, and addons paths whose tree didn't change
+        are skipped. It returns a dictionary
+        `{relative_path: {(module, last_commit), ...}}`.
+        """
+        res = {relative_path: set() for relative_path in relative_paths}
         # Same commits: nothing has changed
         if from_commit == to_commit:
-            return module_paths
-        repo = self.repo
-        # Get only modules updated between the two commits
-        from_commit = repo.commit(from_commit)
-        to_commit = repo.commit(to_commit)
-        diffs = to_commit.diff(from_commit, R=True)
-        for diff in diffs:
-            # Skip diffs that do not belong to the scanned relative path
-            if not diff.a_path.startswith(relative_tree_path):
+            return res
+        from_commit = self._resolve_ref(from_commit)
+        to_commit = self._resolve_ref(to_commit)
+        tree_paths = self._get_addons_paths_updated(
+            relative_paths, from_commit, to_commit
+        )
+        if not tree_paths:
+            return res
+        # Get only files updated between the two commits in these addons paths
+        diff_paths = self.backend.diff_paths(
+            from_commit, to_commit, sorted(set(tree_paths.values()))
+        )
+        # Group updated files by addons path and module
+        modules = {}
+        module_paths = {relative_path: set() for relative_path in tree_paths}
+        for diff_path in diff_paths:
+            # Exclude files located in root folder
+            if "/" not in diff_path:
                 continue
             # Skip diffs that relates to unrelevant files
-            if not self._filter_file_path(diff.a_path):
+            if not self._filter_file_path(diff_path):
                 continue
-            # Exclude files located in root folder
-            if "/" not in diff.a_path:
+            parts = diff_path.split("/")
+            for relative_path, tree_path in tree_paths.items():
+                depth = 0
+                if tree_path:
+                    # Skip diffs that do not belong to the scanned relative path
+                    if not diff_path.startswith(f"{tree_path}/"):
+                        continue
+                    depth = len(tree_path.split("/"))
+                # Exclude files located in the addons path itself
+                if len(parts) <= depth + 1:
+                    continue
+                module_path = "/".join(parts[: depth + 1])
+                if module_path not in modules:
+                    # Removed module
+                    modules[module_path] = self._odoo_module(to_commit, module_path)
+                if modules[module_path]:
+                    module_paths[relative_path].add(module_path)
+        commits = self._get_last_commits_of_paths(
+            to_commit, [module_path for module_path, ok in modules.items() if ok]
+        )
+        for relative_path, paths in module_paths.items():
+            # FIXME: should we return pathlib.Path objects?
+            res[relative_path] = {(path, commits[path]) for path in paths}
+        return res
+
+    def _get_addons_paths_updated(self, relative_paths, from_commit, to_commit):
+        """Return addons paths whose content changed between both commits.
+
+        Trees of addons paths are compared by SHA, so no diff is required.
+        It returns a dictionary `{relative_path: tree_path}`.
+        """
+        tree_paths = {}
+        for relative_path in relative_paths:
+            tree_path = self._get_tree_path(relative_path)
+            to_tree_sha = self.backend.get_tree_sha(to_commit, tree_path)
+            if to_tree_sha is None:
                 continue
-            # Remove the relative_path (e.g. 'addons/') from the diff path
-            rel_path = pathlib.Path(relative_path)
-            diff_path = pathlib.Path(diff.a_path)
-            module_path = pathlib.Path(*diff_path.parts[: len(rel_path.parts) + 1])
-            tree = to_commit.tree / str(module_path)
-            if self._odoo_module(tree):
-                module_paths.add(
-                    # FIXME: should we return pathlib.Path objects?
-                    (tree.path, self._get_commit_of_git_tree(f"origin/{branch}", tree))
-                )
-        return module_paths
+            if self.backend.get_tree_sha(from_commit, tree_path) == to_tree_sha:
+                continue
+            tree_paths[relative_path] = tree_path
+        return tree_paths
 
     def _filter_file_path(self, path):
         for ext in (".po", ".pot", ".rst", ".html"):
@@ -211,38 +926,51 @@ class BaseScanner:
                 return False
         return True
 
-    def _get_commit_of_git_tree(self, ref, tree):
-        return tree.repo.git.log("--pretty=%H", "-n 1", ref, "--", tree.path)
+    def _get_last_commits_of_paths(self, ref, paths):
+        """Return the last commit that touched each path of `paths` in `ref`.
 
-    def _odoo_module(self, tree):
-        """Check if the `git.Tree` object is an Odoo module."""
+        All the paths are resolved in one walk of the `ref` history (instead
+        of one `git log -n 1` per path). It returns a dictionary
+        `{path: last_commit}`.
+        """
+        commits = dict.fromkeys(paths, False)
+        # Paths without history in 'ref' (should not happen) are kept to False
+        commits.update(self.backend.get_last_commits_of_paths(ref, paths))
+        return commits
+
+    def _odoo_module(self, commit, path):
+        """Check if the folder `path` of `commit` is an Odoo module."""
+        entries = self.backend.list_tree(commit, path)
+        if not entries:
+            return False
         # NOTE: it seems we could have data only modules without '__init__.py'
         # like 'odoo/addons/test_data_module/', so the Python package check
         # is maybe not useful
-        return self._manifest_exists(tree)  # and self._python_package(tree)
-
-    def _python_package(self, tree):
-        """Check if the `git.Tree` object is a Python package."""
-        return bool(self._get_subtree(tree, "__init__.py"))
-
-    def _manifest_exists(self, tree):
-        """Check if the `git.Tree` object contains an Odoo manifest file."""
-        manifest_found = False
-        for manifest_file in ("__manifest__.py", "__openerp__.py"):
-            if self._get_subtree(tree, manifest_file):
-                manifest_found = True
-                break
-        return manifest_found
-
-    def _get_subtree(self, tree, path):
-        """Return the subtree `tree / path` if it exists, or `None`."""
-        try:
-            return tree / path
-        except KeyError:  # pylint: disable=except-pass
-            pass
+        return self._manifest_exists(entries)  # and self._python_package(entries)
+
+    def _python_package(self, entries):
+        """Check if the tree `entries` are the ones of a Python package."""
+        return entries.get("__init__.py") == "blob"
+
+    def _manifest_exists(self, entries):
+        """Check if the tree `entries` contain an Odoo manifest file."""
+        return any(
+            entries.get(manifest_file) == "blob"
+            for manifest_file in self._manifest_files
+        )
 
 
 class MigrationScanner(BaseScanner):
+    _hooks = (
+        "_get_odoo_repository_id",
+        "_get_odoo_repository_branches",
+        "_get_odoo_migration_paths",
+        "_get_odoo_module_branch_id",
+        "_get_odoo_module_branch_migration_id",
+        "_get_odoo_module_branch_migration_data",
+        "_push_scanned_data",
+    )
+
     def __init__(
         self,
         org: str,
@@ -252,32 +980,55 @@ class MigrationScanner(BaseScanner):
         repositories_path: str = None,
         ssh_key: str = None,
         github_token: str = None,
+        partial_clone: bool = False,
+        git_backend: str = "gitpython",
+        object_store: str = None,
+        bundles_path: str = None,
     ):
         branches = sorted(set(sum([tuple(mp) for mp in migration_paths], ())))
         super().__init__(
-            org, name, clone_url, branches, repositories_path, ssh_key, github_token
+            org,
+            name,
+            clone_url,
+            branches,
+            repositories_path,
+            ssh_key,
+            github_token,
+            partial_clone,
+            git_backend,
+            object_store,
+            bundles_path,
         )
         self.migration_paths = migration_paths
 
     def scan(self):
-        res = super().scan()
-        repo_id = self._get_odoo_repository_id()
-        # Get the repository branches from Odoo as the ones we got as parameter
-        # could not exist in the repository
-        self._get_odoo_repository_branches(repo_id)
-        for source_branch, target_branch in self.migration_paths:
-            if self._branch_exists(source_branch) and self._branch_exists(
-                target_branch
-            ):
-                self._scan_migration_path(source_branch, target_branch)
-        return res
+        with self._git_session():
+            res = super().scan()
+            repo_id = self._get_odoo_repository_id()
+            # Get the repository branches from Odoo as the ones we got as parameter
+            # could not exist in the repository
+            self._get_odoo_repository_branches(repo_id)
+            for source_branch, target_branch in self.migration_paths:
+                if self._branch_exists(source_branch) and self._branch_exists(
+                    target_branch
+                ):
+                    self._scan_migration_path(source_branch, target_branch)
+            return res
 
     def _scan_migration_path(self, source_branch, target_branch):
-        repo = self.repo
-        repo_source_commit = self._get_last_fetched_commit(source_branch)
         repo_target_commit = self._get_last_fetched_commit(target_branch)
+        # Modules are returned with their last commit in the source branch
         modules = self._get_module_paths(".", source_branch)
-        for module, __ in modules:
+        # Get the last commit of all modules in the target branch at once
+        module_target_paths = [
+            module
+            for module, __ in modules
+            if self.backend.get_tree_sha(repo_target_commit, module)
+        ]
+        module_target_commits = self._get_last_commits_of_paths(
+            repo_target_commit, module_target_paths
+        )
+        for module, module_source_commit in modules:
             module_branch_id = self._get_odoo_module_branch_id(module, source_branch)
             if not module_branch_id:
                 _logger.warning(
@@ -289,20 +1040,7 @@ class MigrationScanner(BaseScanner):
             # For each module and source/target branch:
             #   - get commit of 'module' relative to the last fetched commit
             #   - get commit of 'module' relative to the last scanned commit
-            module_source_tree = self._get_subtree(
-                repo.commit(repo_source_commit).tree, module
-            )
-            module_target_tree = self._get_subtree(
-                repo.commit(repo_target_commit).tree, module
-            )
-            module_source_commit = self._get_commit_of_git_tree(
-                repo_source_commit, module_source_tree
-            )
-            module_target_commit = (
-                module_target_tree
-                and self._get_commit_of_git_tree(repo_target_commit, module_target_tree)
-                or False
-            )
+            module_target_commit = module_target_commits.get(module, False)
             # Retrieve existing migration data if any and check if it is outdated
             data = self._get_odoo_module_branch_migration_data(
                 module, source_branch, target_branch
@@ -419,6 +1157,18 @@ class MigrationScanner(BaseScanner):
 
 
 class RepositoryScanner(BaseScanner):
+    _hooks = (
+        "_get_odoo_repository_id",
+        "_add_odoo_repository_addons_paths",
+        "_get_odoo_branch_id",
+        "_get_odoo_repository_branch_id",
+        "_create_odoo_repository_branch",
+        "_get_repo_last_scanned_commit",
+        "_get_modules_last_scanned_commits",
+        "_push_scanned_data",
+        "_update_last_scanned_commit",
+    )
+
     def __init__(
         self,
         org: str,
@@ -429,19 +1179,57 @@ class RepositoryScanner(BaseScanner):
         repositories_path: str = None,
         ssh_key: str = None,
         github_token: str = None,
+        partial_clone: bool = False,
+        git_backend: str = "gitpython",
+        object_store: str = None,
+        bundles_path: str = None,
+        discover_addons_paths: bool = False,
+        analysis_cache_size: int = 10000,
+        workers: int = 0,
+        worker_memory_limit: int = 1024,
+        sloc_backend: str = "builtin",
     ):
         super().__init__(
-            org, name, clone_url, branches, repositories_path, ssh_key, github_token
+            org,
+            name,
+            clone_url,
+            branches,
+            repositories_path,
+            ssh_key,
+            github_token,
+            partial_clone,
+            git_backend,
+            object_store,
+            bundles_path,
         )
         self.addons_paths_data = addons_paths_data
+        # Look for addons paths in the scanned branches (see
+        # `_get_addons_paths_data`)
+        self.discover_addons_paths = discover_addons_paths
+        self.analysis_cache = None
+        if analysis_cache_size:
+            self.analysis_cache = AnalysisCache(
+                self.repositories_path.joinpath(".analysis_cache.sqlite"),
+                max_entries=analysis_cache_size,
+            )
+        # Number of processes used to analyze modules (0 = no process pool),
+        # and memory (MB) each of them is allowed to allocate
+        self.workers = workers
+        self.worker_memory_limit = worker_memory_limit
+        # Tool counting SLOC ('builtin' or 'pygount')
+        self.sloc_backend = sloc_backend
+        # Last scanned commit of each module of the repository/branch being
+        # scanned (see `_is_module_scanned`)
+        self._modules_last_scanned_commits = {}
 
     def scan(self):
-        res = super().scan()
-        repo_id = self._get_odoo_repository_id()
-        branches_scanned = {}
-        for branch in self.branches:
-            branches_scanned[branch] = self._scan_branch(repo_id, branch)
-        return res
+        with self._git_session():
+            res = super().scan()
+            repo_id = self._get_odoo_repository_id()
+            branches_scanned = {}
+            for branch in self.branches:
+                branches_scanned[branch] = self._scan_branch(repo_id, branch)
+            return res
 
     def _scan_branch(self, repo_id, branch):
         if not self._branch_exists(branch):
@@ -450,25 +1238,73 @@ class RepositoryScanner(BaseScanner):
         repo_branch_id = self._create_odoo_repository_branch(repo_id, branch_id)
         last_fetched_commit = self._get_last_fetched_commit(branch)
         last_scanned_commit = self._get_repo_last_scanned_commit(repo_branch_id)
-        if last_fetched_commit != last_scanned_commit:
-            # Checkout the source branch to:
-            #   - get the last commit of a module working tree
-            #   - perform module code analysis
-            self._checkout_branch(branch)
+        # With `discover_addons_paths`, an unchanged branch is still scanned
+        # to look for new addons paths, only modules never scanned being
+        # then analyzed (see `_get_unscanned_module_paths`)
+        if last_fetched_commit != last_scanned_commit or self.discover_addons_paths:
+            # Modules are analyzed from the Git objects of the last fetched
+            # commit, so there is no need to checkout the branch
+            # (allowing to scan several branches of a repository in parallel)
+            addons_paths_data = self._get_addons_paths_data(repo_id, branch)
+            self._modules_last_scanned_commits = self._get_modules_last_scanned_commits(
+                repo_branch_id
+            )
+            updated_module_paths = {}
+            if last_scanned_commit:
+                # Get module paths updated since the last scanned commit
+                # in all addons paths at once
+                updated_module_paths = self._get_module_paths_updated_by_addons_path(
+                    [data["relative_path"] for data in addons_paths_data],
+                    from_commit=last_scanned_commit,
+                    to_commit=last_fetched_commit,
+                )
             # Scan relevant subfolders of the repository
-            for addons_path_data in self.addons_paths_data:
+            for addons_path_data in addons_paths_data:
                 self._scan_addons_path(
                     addons_path_data,
                     branch,
                     repo_branch_id,
                     last_fetched_commit,
                     last_scanned_commit,
+                    updated_module_paths.get(addons_path_data["relative_path"]),
                 )
             # Flag this repository/branch as scanned
             self._update_last_scanned_commit(repo_branch_id, last_fetched_commit)
             return True
         return False
 
+    def _get_addons_paths_data(self, repo_id, branch):
+        """Return the addons paths to scan in `branch`.
+
+        With `discover_addons_paths`, addons paths found in the branch (see
+        `_discover_addons_paths`) are added to the configured ones, flagged
+        like the first configured addons path (community ones by default),
+        and recorded on the repository.
+        """
+        addons_paths_data = list(self.addons_paths_data)
+        if not self.discover_addons_paths:
+            return addons_paths_data
+        tree_paths = {
+            self._get_tree_path(data["relative_path"]) for data in addons_paths_data
+        }
+        flags = {"is_standard": False, "is_enterprise": False, "is_community": True}
+        if addons_paths_data:
+            flags = {flag: addons_paths_data[0][flag] for flag in flags}
+        discovered_data = [
+            dict(flags, relative_path=relative_path)
+            for relative_path in self._discover_addons_paths(branch)
+            if self._get_tree_path(relative_path) not in tree_paths
+        ]
+        if discovered_data:
+            _logger.info(
+                "%s: addons path(s) %s discovered on %s",
+                self.full_name,
+                ", ".join(data["relative_path"] for data in discovered_data),
+                branch,
+            )
+            self._add_odoo_repository_addons_paths(repo_id, discovered_data)
+        return addons_paths_data + discovered_data
+
     def _scan_addons_path(
         self,
         addons_path_data,
@@ -476,11 +1312,14 @@ class RepositoryScanner(BaseScanner):
         repo_branch_id,
         last_fetched_commit,
         last_scanned_commit,
+        updated_module_paths=None,
     ):
         if not last_scanned_commit:
             module_paths = sorted(
                 self._get_module_paths(addons_path_data["relative_path"], branch)
             )
+        elif updated_module_paths is not None:
+            module_paths = sorted(updated_module_paths)
         else:
             # Get module paths updated since the last scanned commit
             module_paths = sorted(
@@ -491,6 +1330,13 @@ class RepositoryScanner(BaseScanner):
                     branch=branch,
                 )
             )
+        if last_scanned_commit:
+            module_paths = sorted(
+                module_paths
+                + self._get_unscanned_module_paths(
+                    addons_path_data["relative_path"], branch, module_paths
+                )
+            )
         extra_log = ""
         if addons_path_data["relative_path"] != ".":
             extra_log = f" in {addons_path_data['relative_path']}"
@@ -501,6 +1347,14 @@ class RepositoryScanner(BaseScanner):
             branch,
         )
         # Scan each module
+        if self.workers > 1:
+            return self._scan_modules_in_parallel(
+                branch,
+                repo_branch_id,
+                module_paths,
+                addons_path_data,
+                last_fetched_commit,
+            )
         for module_path, last_module_commit in module_paths:
             self._scan_module(
                 branch,
@@ -508,8 +1362,33 @@ class RepositoryScanner(BaseScanner):
                 module_path,
                 last_module_commit,
                 addons_path_data,
+                last_fetched_commit,
             )
 
+    def _get_unscanned_module_paths(self, relative_path, branch, module_paths):
+        """Return the modules of `branch` never scanned, not in `module_paths`.
+
+        Modules not updated since the last scanned commit have still to be
+        scanned if they never were, e.g. in an addons path discovered or
+        configured since the last scan, or if the scan of a new addons path
+        has been interrupted.
+        It returns a list of tuples `[(module, last_commit), ...]`.
+        """
+        relative_tree_path = self._get_tree_path(relative_path)
+        branch_commit = self._get_last_fetched_commit(branch)
+        known_paths = {module_path for module_path, __ in module_paths}
+        unscanned_paths = sorted(
+            module_dir
+            for module_dir in self._get_module_dirs(branch_commit, relative_tree_path)
+            if module_dir.rpartition("/")[0] == relative_tree_path
+            and module_dir not in known_paths
+            and module_dir.split("/")[-1] not in self._modules_last_scanned_commits
+        )
+        if not unscanned_paths:
+            return []
+        commits = self._get_last_commits_of_paths(branch_commit, unscanned_paths)
+        return [(module_path, commits[module_path]) for module_path in unscanned_paths]
+
     def _scan_module(
         self,
         branch,
@@ -517,17 +1396,10 @@ class RepositoryScanner(BaseScanner):
         module_path,
         last_module_commit,
         addons_path_data,
+        commit,
     ):
         module = module_path.split("/")[-1]
-        last_module_scanned_commit = self._get_module_last_scanned_commit(
-            repo_branch_id, module
-        )
-        # Do not scan if the module didn't changed since last scan
-        # NOTE we also do this check at the model level so if the process
-        # is interrupted (time limit, not enough memory...) we could
-        # resume the work where it stopped by skipping already scanned
-        # modules.
-        if last_module_scanned_commit == last_module_commit:
+        if self._is_module_scanned(repo_branch_id, module, last_module_commit):
             return
         _logger.info(
             "%s#%s: scan '%s' ",
@@ -535,18 +1407,162 @@ class RepositoryScanner(BaseScanner):
             branch,
             module_path,
         )
-        data = self._run_code_analysis(module_path)
+        data = self._run_code_analysis(module_path, commit)
+        self._push_module_data(
+            repo_branch_id, module, last_module_commit, addons_path_data, data
+        )
+
+    def _is_module_scanned(self, repo_branch_id, module, last_module_commit):
+        """Check if `module` has already been scanned at `last_module_commit`.
+
+        The last scanned commits of the modules are loaded once per
+        repository/branch (see `_scan_branch`), and kept up to date as
+        modules are pushed.
+        """
+        last_module_scanned_commit = self._modules_last_scanned_commits.get(module)
+        # Do not scan if the module didn't changed since last scan
+        # NOTE we also do this check at the model level so if the process
+        # is interrupted (time limit, not enough memory...) we could
+        # resume the work where it stopped by skipping already scanned
+        # modules.
+        return last_module_scanned_commit == last_module_commit
+
+    def _push_module_data(
+        self, repo_branch_id, module, last_module_commit, addons_path_data, data
+    ):
         if data["manifest"]:
             # Insert all flags 'is_standard', 'is_enterprise', etc
             data.update(addons_path_data)
             # Set the last fetched commit as last scanned commit
             data["last_scanned_commit"] = last_module_commit
             self._push_scanned_data(repo_branch_id, module, data)
+            self._modules_last_scanned_commits[module] = last_module_commit
 
-    def _run_code_analysis(self, module_path):
-        """Perform a code analysis of `module_path`."""
-        module_analysis = ModuleAnalysis(f"{self.path}/{module_path}")
-        return module_analysis.to_dict()
+    def _scan_modules_in_parallel(
+        self,
+        branch,
+        repo_branch_id,
+        module_paths,
+        addons_path_data,
+        commit,
+    ):
+        """Analyze modules with a pool of processes.
+
+        Modules are analyzed from the largest to the smallest one (in number
+        of files) to reduce the tail latency, and their data are pushed as
+        soon as they are available.
+        """
+        commit_tree = self._get_commit(commit).tree
+        modules_to_analyze = {}
+        for module_path, last_module_commit in module_paths:
+            module = module_path.split("/")[-1]
+            if self._is_module_scanned(repo_branch_id, module, last_module_commit):
+                continue
+            tree = commit_tree / module_path
+            data = self.analysis_cache and self.analysis_cache.get(
+                self._get_analysis_cache_key(tree)
+            )
+            if data:
+                _logger.info(
+                    "%s#%s: scan '%s' (cached)", self.full_name, branch, module_path
+                )
+                self._push_module_data(
+                    repo_branch_id, module, last_module_commit, addons_path_data, data
+                )
+                continue
+            size = sum(1 for item in tree.traverse() if item.type == "blob")
+            modules_to_analyze[module_path] = (tree, last_module_commit, size)
+        if not modules_to_analyze:
+            return
+        cache_path = cache_size = None
+        if self.analysis_cache:
+            cache_path = self.analysis_cache.path
+            cache_size = self.analysis_cache.max_entries
+        # NOTE: 'fork' is used as Odoo addons cannot be imported from
+        # a new Python interpreter
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_analysis_worker,
+            initargs=(str(self.path), self.worker_memory_limit),
+        )
+        with self._get_git_env() as git_env, executor:
+            futures = {
+                executor.submit(
+                    _analyze_module,
+                    commit,
+                    module_path,
+                    cache_path,
+                    cache_size,
+                    git_env if self.partial_clone else None,
+                    self.sloc_backend,
+                ): module_path
+                for module_path in sorted(
+                    modules_to_analyze,
+                    key=lambda path: modules_to_analyze[path][2],
+                    reverse=True,
+                )
+            }
+            try:
+                for future in as_completed(futures):
+                    module_path = futures[future]
+                    tree, last_module_commit, __ = modules_to_analyze[module_path]
+                    _logger.info(
+                        "%s#%s: scan '%s' ", self.full_name, branch, module_path
+                    )
+                    data = future.result()
+                    if self.analysis_cache:
+                        self.analysis_cache.set(
+                            self._get_analysis_cache_key(tree), data
+                        )
+                    module = module_path.split("/")[-1]
+                    self._push_module_data(
+                        repo_branch_id,
+                        module,
+                        last_module_commit,
+                        addons_path_data,
+                        data,
+                    )
+            except Exception:
+                executor.shutdown(cancel_futures=True)
+                raise
+
+    def _run_code_analysis(self, module_path, commit):
+        """Perform a code analysis of `module_path` as of `commit`.
+
+        Files are read from the Git object database, not from the working tree.
+        Results are cached by tree SHA, so an unchanged module found in another
+        branch, fork or addons path is not analyzed again.
+        """
+        tree = self._get_commit(commit).tree / module_path
+        if self.analysis_cache:
+            data = self.analysis_cache.get(self._get_analysis_cache_key(tree))
+            if data is not None:
+                return data
+        # Files which didn't change since the last scan (same blob) are
+        # not counted again, only the ones reported by the diff are
+        fetch_blobs = None
+        if self.partial_clone:
+            fetch_blobs = functools.partial(self._fetch_missing_blobs, tree)
+        module_analysis = ModuleAnalysis(
+            module_path,
+            tree=tree,
+            blob_cache=self.analysis_cache,
+            fetch_blobs=fetch_blobs,
+            sloc_backend=self.sloc_backend,
+        )
+        data = module_analysis.to_dict()
+        if self.analysis_cache:
+            self.analysis_cache.set(self._get_analysis_cache_key(tree), data)
+        return data
+
+    def _get_analysis_cache_key(self, tree):
+        """Return the key of the analysis of the module `tree` in the cache.
+
+        SLOC counted by different tools could differ, so the tool is part
+        of the key.
+        """
+        return f"{tree.hexsha}:{self.sloc_backend}"
 
     # Hooks method to override by client class
 
@@ -554,6 +1570,10 @@ class RepositoryScanner(BaseScanner):
         """Return the ID of the 'odoo.repository' record."""
         raise NotImplementedError
 
+    def _add_odoo_repository_addons_paths(self, repo_id, addons_paths_data):
+        """Add the discovered addons paths to the 'odoo.repository' record."""
+        raise NotImplementedError
+
     def _get_odoo_branch_id(self, repo_id, branch):
         """Return the ID of the relevant 'odoo.branch' record.
 
@@ -575,8 +1595,11 @@ class RepositoryScanner(BaseScanner):
         """Return the last scanned commit of the repository/branch."""
         raise NotImplementedError
 
-    def _get_module_last_scanned_commit(self, repo_branch_id, module):
-        """Return the last scanned commit of the module."""
+    def _get_modules_last_scanned_commits(self, repo_branch_id):
+        """Return the last scanned commit of the modules of the repository/branch.
+
+        It returns a dictionary `{module: last_scanned_commit}`.
+        """
         raise NotImplementedError
 
     def _push_scanned_data(self, repo_branch_id, module, data):
@@ -1,15 +1,33 @@
 # Copyright 2023 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
+import logging
 import random
 import time
 from urllib.parse import urlparse
 
-from odoo import api, fields, models, tools
+from psycopg2 import errors
+
+from odoo import api, fields, models
 
 from odoo.addons.queue_job.exception import RetryableJobError
 
 from ..utils import github
+from ..utils.reference_cache import ReferenceCache
+
+_logger = logging.getLogger(__name__)
+
+# Models referenced by the modules scanned data, resolved by name (see
+# `OdooModuleBranch._get_record_ids_by_name`)
+REFERENCE_MODELS = (
+    "odoo.module",
+    "odoo.module.category",
+    "odoo.author",
+    "odoo.maintainer",
+    "odoo.module.dev.status",
+    "odoo.license",
+    "odoo.python.dependency",
+)
 
 
 class OdooModuleBranch(models.Model):
@@ -220,35 +238,150 @@ class OdooModuleBranch(models.Model):
         manifest = data["manifest"]
         module = self._get_module(module)
         repo_branch = self.env["odoo.repository.branch"].browse(repo_branch_id)
-        category_id = self._get_module_category_id(manifest.get("category", ""))
-        author_ids = self._get_author_ids(manifest.get("author", ""))
-        maintainer_ids = self._get_maintainer_ids(
-            tuple(manifest.get("maintainers", []))
+        external_dependencies = manifest.get("external_dependencies", {})
+        references = {
+            "category_id": self._get_module_category_id(manifest.get("category", "")),
+            "author_ids": self._get_author_ids(manifest.get("author", "")),
+            "maintainer_ids": self._get_maintainer_ids(
+                tuple(manifest.get("maintainers", []))
+            ),
+            "development_status_id": self._get_dev_status_id(
+                manifest.get("development_status", "")
+            ),
+            "dependency_ids": self._get_dependency_ids(
+                repo_branch, manifest.get("depends", [])
+            ),
+            "python_dependency_ids": self._get_python_dependency_ids(
+                tuple(external_dependencies.get("python", []))
+            ),
+            "license_id": self._get_license_id(manifest.get("license", "")),
+        }
+        values = self._prepare_scanned_data_values(
+            repo_branch, module.id, data, references
+        )
+        return self._create_or_update(repo_branch, module, values)
+
+    @api.model
+    def push_scanned_data_batch(self, repo_branch_id, modules_data):
+        """Entry point for the scanner to push the data of several modules.
+
+        `modules_data` is a list of dictionaries `{"module": name, "data": data}`
+        (`data` being the one expected by `push_scanned_data`). References
+        (modules, categories, authors...) of all the modules are resolved at
+        once, then each module is saved in its own savepoint so an error
+        doesn't prevent the others to be saved.
+
+        It returns a list of dictionaries `{"module": name, "id": id}`, or
+        `{"module": name, "error": message}` for modules not saved.
+        """
+        repo_branch = self.env["odoo.repository.branch"].browse(repo_branch_id)
+        # Invalid data are reported when saving the modules
+        manifests = {
+            module_data["module"]: module_data["data"].get("manifest") or {}
+            for module_data in modules_data
+        }
+        # Resolve the references of all the modules
+        module_names = set(manifests)
+        category_names, author_names, maintainer_names = set(), set(), set()
+        dev_status_names, license_names, package_names = set(), set(), set()
+        for manifest in manifests.values():
+            module_names.update(manifest.get("depends", []))
+            category_names.add(manifest.get("category", ""))
+            author_names.update(self._split_author_names(manifest.get("author", "")))
+            maintainer_names.update(manifest.get("maintainers", []))
+            dev_status_names.add(manifest.get("development_status", ""))
+            license_names.add(manifest.get("license", ""))
+            package_names.update(
+                manifest.get("external_dependencies", {}).get("python", [])
+            )
+        module_ids = self._get_record_ids_by_name("odoo.module", module_names)
+        module_branch_ids = self._get_module_branch_ids(
+            repo_branch.branch_id, module_ids.values()
         )
-        dev_status_id = self._get_dev_status_id(manifest.get("development_status", ""))
-        dependency_ids = self._get_dependency_ids(
-            repo_branch, manifest.get("depends", [])
+        category_ids = self._get_record_ids_by_name(
+            "odoo.module.category", category_names
         )
-        external_dependencies = manifest.get("external_dependencies", {})
-        python_dependency_ids = self._get_python_dependency_ids(
-            tuple(external_dependencies.get("python", []))
+        author_ids = self._get_record_ids_by_name("odoo.author", author_names)
+        maintainer_ids = self._get_record_ids_by_name(
+            "odoo.maintainer", maintainer_names
+        )
+        dev_status_ids = self._get_record_ids_by_name(
+            "odoo.module.dev.status", dev_status_names
+        )
+        license_ids = self._get_record_ids_by_name("odoo.license", license_names)
+        package_ids = self._get_record_ids_by_name(
+            "odoo.python.dependency", package_names
         )
-        license_id = self._get_license_id(manifest.get("license", ""))
-        values = {
+        # Save each module
+        res = []
+        for module_data in modules_data:
+            module, data = module_data["module"], module_data["data"]
+            try:
+                manifest = data["manifest"]
+                external_dependencies = manifest.get("external_dependencies", {})
+                references = {
+                    "category_id": category_ids.get(
+                        manifest.get("category", ""), False
+                    ),
+                    "author_ids": [
+                        author_ids[name]
+                        for name in self._split_author_names(manifest.get("author", ""))
+                    ],
+                    "maintainer_ids": [
+                        maintainer_ids[name]
+                        for name in manifest.get("maintainers", [])
+                        if name
+                    ],
+                    "development_status_id": dev_status_ids.get(
+                        manifest.get("development_status", ""), False
+                    ),
+                    "dependency_ids": [
+                        module_branch_ids[module_ids[name]]
+                        for name in manifest.get("depends", [])
+                        if name
+                    ],
+                    "python_dependency_ids": [
+                        package_ids[name]
+                        for name in external_dependencies.get("python", [])
+                        if name
+                    ],
+                    "license_id": license_ids.get(manifest.get("license", ""), False),
+                }
+                module_id = module_ids[module]
+                values = self._prepare_scanned_data_values(
+                    repo_branch, module_id, data, references
+                )
+                with ReferenceCache.get(self.env.cr).savepoint(self.env.cr):
+                    self.browse(module_branch_ids[module_id]).sudo().write(values)
+            except Exception as exc:  # pylint: disable=broad-except
+                _logger.warning("Unable to save scanned data of %s: %s", module, exc)
+                res.append({"module": module, "error": str(exc)})
+            else:
+                res.append({"module": module, "id": module_branch_ids[module_id]})
+        return res
+
+    def _prepare_scanned_data_values(self, repo_branch, module_id, data, references):
+        """Return the values of the module scanned data.
+
+        `references` contains the IDs of the records referenced by the module,
+        indexed by field name.
+        """
+        manifest = data["manifest"]
+        return {
             "repository_branch_id": repo_branch.id,
             "branch_id": repo_branch.branch_id.id,
-            "module_id": module.id,
+            "module_id": module_id,
             "title": manifest.get("name", False),
             "summary": manifest.get("summary", manifest.get("description", False)),
-            "category_id": category_id,
-            "author_ids": [(6, 0, author_ids)],
-            "maintainer_ids": [(6, 0, maintainer_ids)],
-            "dependency_ids": [(6, 0, dependency_ids)],
-            "external_dependencies": external_dependencies,
-            "python_dependency_ids": [(6, 0, python_dependency_ids)],
-            "license_id": license_id,
+            "category_id": references["category_id"],
+            "author_ids": [(6, 0, references["author_ids"])],
+            "maintainer_ids": [(6, 0, references["maintainer_ids"])],
+            "dependency_ids": [(6, 0, references["dependency_ids"])],
+            "external_dependencies": manifest.get("external_dependencies", {}),
+            "python_dependency_ids": [(6, 0, references["python_dependency_ids"])],
+            "license_id": references["license_id"],
             "version": manifest.get("version", False),
-            "development_status_id": dev_status_id,
+            "development_status_id": references["development_status_id"],
             "application": manifest.get("application", False),
             "installable": manifest.get("installable", True),
             "auto_install": manifest.get("auto_install", False),
@@ -263,7 +396,120 @@ class OdooModuleBranch(models.Model):
             # Unset PR URL once the module is available in the repository.
             "pr_url": False,
         }
-        return self._create_or_update(repo_branch, module, values)
+
+    @api.model
+    def _get_record_ids_by_name(self, model, names):
+        """Return the IDs of `model` records by name, creating missing ones.
+
+        Names are resolved from the cache of the database cursor (see
+        `ReferenceCache`), the others being upserted at once (see
+        `_upsert_records_by_name`). It returns a dictionary `{name: id}`
+        (empty names being ignored).
+        """
+        names = {name for name in names if name}
+        if not names:
+            return {}
+        cache = ReferenceCache.get(self.env.cr)
+        ids = cache.get_ids(model, names)
+        missing_names = names - set(ids)
+        if missing_names:
+            upserted_ids = self._upsert_records_by_name(model, missing_names)
+            cache.add(model, upserted_ids)
+            ids.update(upserted_ids)
+        return ids
+
+    @api.model
+    def _upsert_records_by_name(self, model, names):
+        """Create the `model` records named `names` if they do not exist.
+
+        All the records are inserted with one query, names already taken
+        by records visible to the transaction being skipped thanks to the
+        unique constraint on `name`, then all the IDs are read at once.
+        It returns a dictionary `{name: id}`.
+
+        Transactions run in REPEATABLE READ isolation: if a record has been
+        committed by another transaction (e.g. a parallel scan job) after the
+        snapshot of this one, the insert fails with a serialization failure,
+        the record being invisible to this transaction. The error is raised
+        as is, Odoo (RPC) and queue_job (jobs) retrying the whole transaction
+        on such errors, with a new snapshot including the record.
+        """
+        table = self.env[model]._table
+        self.env[model].flush_model(["name"])
+        now = fields.Datetime.now()
+        try:
+            self.env.cr.execute(
+                f"""
+                INSERT INTO {table}
+                    (name, create_uid, create_date, write_uid, write_date)
+                SELECT name, %(uid)s, %(now)s, %(uid)s, %(now)s
+                FROM unnest(%(names)s) AS name
+                ORDER BY name
+                ON CONFLICT (name) DO NOTHING
+                """,  # nosec B608: the table name comes from the registry
+                {"names": sorted(names), "uid": self.env.uid, "now": now},
+            )
+        except errors.SerializationFailure:
+            _logger.info(
+                "%s records created by a concurrent transaction, "
+                "the transaction will be retried",
+                model,
+            )
+            raise
+        self.env.cr.execute(
+            f"SELECT name, id FROM {table} WHERE name = ANY(%s)",  # nosec B608
+            (list(names),),
+        )
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _preload_references(self):
+        """Load the IDs of all the references in the transaction cache.
+
+        Called when a scan starts, so the names of the modules, authors,
+        licenses... already known are resolved without querying the database.
+        """
+        cache = ReferenceCache.get(self.env.cr)
+        for model in REFERENCE_MODELS:
+            self.env[model].flush_model(["name"])
+            self.env.cr.execute(
+                f"SELECT name, id FROM {self.env[model]._table}"  # nosec B608
+            )
+            cache.add(model, self.env.cr.fetchall())
+
+    @api.model
+    def _get_module_branch_ids(self, branch, module_ids):
+        """Return the IDs of the modules `module_ids` in `branch`.
+
+        Modules not yet available in the branch (e.g. dependencies not yet
+        scanned) are created at once. It returns a dictionary
+        `{module_id: module_branch_id}`.
+        """
+        module_ids = set(module_ids)
+        if not module_ids:
+            return {}
+        module_branches = self.search(
+            [("branch_id", "=", branch.id), ("module_id", "in", list(module_ids))]
+        )
+        ids = {
+            module_branch.module_id.id: module_branch.id
+            for module_branch in module_branches
+        }
+        missing_module_ids = module_ids - set(ids)
+        if missing_module_ids:
+            created = self.sudo().create(
+                [
+                    {"module_id": module_id, "branch_id": branch.id}
+                    for module_id in sorted(missing_module_ids)
+                ]
+            )
+            ids.update(
+                {
+                    module_branch.module_id.id: module_branch.id
+                    for module_branch in created
+                }
+            )
+        return ids
 
     def _create_or_update(self, repo_branch, module, values):
         args = [
@@ -277,114 +523,54 @@ class OdooModuleBranch(models.Model):
             module_branch = self.sudo().create(values)
         return module_branch
 
-    @tools.ormcache("category_name")
     def _get_module_category_id(self, category_name):
-        if category_name:
-            rec = self.env["odoo.module.category"].search(
-                [("name", "=", category_name)], limit=1
-            )
-            if not rec:
-                rec = (
-                    self.env["odoo.module.category"]
-                    .sudo()
-                    .create({"name": category_name})
-                )
-            return rec.id
-        return False
+        ids = self._get_record_ids_by_name("odoo.module.category", [category_name])
+        return ids.get(category_name, False)
 
-    @tools.ormcache("names")
     def _get_author_ids(self, names):
-        if names:
-            # Some Odoo std modules have a list instead of a string as 'author'
-            if isinstance(names, str):
-                names = [name.strip() for name in names.split(",")]
-            authors = self.env["odoo.author"].search([("name", "in", names)])
-            missing_author_names = set(names) - set(authors.mapped("name"))
-            missing_authors = self.env["odoo.author"]
-            if missing_author_names:
-                missing_authors = (
-                    self.env["odoo.author"]
-                    .sudo()
-                    .create([{"name": name} for name in missing_author_names])
-                )
-            return (authors | missing_authors).ids
-        return []
+        names = self._split_author_names(names)
+        ids = self._get_record_ids_by_name("odoo.author", names)
+        return [ids[name] for name in names]
+
+    @api.model
+    def _split_author_names(self, names):
+        """Return the list of author names of a manifest."""
+        # Some Odoo std modules have a list instead of a string as 'author'
+        if isinstance(names, str):
+            names = [name.strip() for name in names.split(",")]
+        return [name for name in names if name]
 
-    @tools.ormcache("names")
     def _get_maintainer_ids(self, names):
-        if names:
-            maintainers = self.env["odoo.maintainer"].search([("name", "in", names)])
-            missing_maintainer_names = set(names) - set(maintainers.mapped("name"))
-            created = self.env["odoo.maintainer"]
-            if missing_maintainer_names:
-                created = created.sudo().create(
-                    [{"name": name} for name in missing_maintainer_names]
-                )
-            return (maintainers | created).ids
-        return []
+        ids = self._get_record_ids_by_name("odoo.maintainer", names)
+        return [ids[name] for name in names if name]
 
-    @tools.ormcache("name")
     def _get_dev_status_id(self, name):
-        if name:
-            rec = self.env["odoo.module.dev.status"].search(
-                [("name", "=", name)], limit=1
-            )
-            if not rec:
-                rec = self.env["odoo.module.dev.status"].sudo().create({"name": name})
-            return rec.id
-        return False
+        ids = self._get_record_ids_by_name("odoo.module.dev.status", [name])
+        return ids.get(name, False)
 
     def _get_dependency_ids(self, repo_branch, depends: list):
-        dependency_ids = []
-        for depend in depends:
-            module = self._get_module(depend)
-            dependency = self.search(
-                [
-                    ("module_id", "=", module.id),
-                    ("branch_id", "=", repo_branch.branch_id.id),
-                ]
-            )
-            if not dependency:
-                dependency = self.sudo().create(
-                    {
-                        "module_id": module.id,
-                        "branch_id": repo_branch.branch_id.id,
-                    }
-                )
-            dependency_ids.append(dependency.id)
-        return dependency_ids
+        """Return the IDs of the `depends` modules in the branch of `repo_branch`.
+
+        All the modules are resolved at once (see `_get_module_branch_ids`),
+        modules not yet available in the branch being created as placeholders.
+        """
+        module_ids = self._get_record_ids_by_name("odoo.module", depends)
+        module_branch_ids = self._get_module_branch_ids(
+            repo_branch.branch_id, module_ids.values()
+        )
+        return [module_branch_ids[module_ids[depend]] for depend in depends if depend]
 
-    @tools.ormcache("packages")
     def _get_python_dependency_ids(self, packages):
-        if packages:
-            dependencies = self.env["odoo.python.dependency"].search(
-                [("name", "in", packages)]
-            )
-            missing_dependencies = set(packages) - set(dependencies.mapped("name"))
-            created = self.env["odoo.python.dependency"]
-            if missing_dependencies:
-                created = created.sudo().create(
-                    [{"name": package} for package in missing_dependencies]
-                )
-            return (dependencies | created).ids
-        return []
+        ids = self._get_record_ids_by_name("odoo.python.dependency", packages)
+        return [ids[package] for package in packages if package]
 
-    @tools.ormcache("license_name")
     def _get_license_id(self, license_name):
-        if license_name:
-            license_model = self.env["odoo.license"]
-            rec = license_model.search([("name", "=", license_name)], limit=1)
-            if not rec:
-                rec = license_model.sudo().create({"name": license_name})
-            return rec.id
-        return False
-
-    @tools.ormcache("name")
+        ids = self._get_record_ids_by_name("odoo.license", [license_name])
+        return ids.get(license_name, False)
+
     def _get_module(self, name):
-        module = self.env["odoo.module"].search([("name", "=", name)])
-        if not module:
-            module = self.env["odoo.module"].sudo().create({"name": name})
-        return module
+        ids = self._get_record_ids_by_name("odoo.module", [name])
+        return self.env["odoo.module"].browse(ids.get(name))
 
     # TODO adds ormcache
     def _get_modules_data(self, orgs=None, repositories=None, branches=None):
@@ -1,21 +1,30 @@
 # Copyright 2023 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
+import datetime
 import json
+import logging
 import os
 import pathlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError
 
-from odoo.addons.queue_job.delay import chain
+from odoo.addons.queue_job.delay import chain, group
 from odoo.addons.queue_job.exception import RetryableJobError
 from odoo.addons.queue_job.job import identity_exact
 
+from ..lib import isolation
+from ..lib.scanner import BaseScanner
+from ..utils import github
 from ..utils.scanner import RepositoryScannerOdooEnv
 
+_logger = logging.getLogger(__name__)
+
 
 class OdooRepository(models.Model):
     _name = "odoo.repository"
@@ -23,6 +32,8 @@ class OdooRepository(models.Model):
     _order = "sequence, display_name"
 
     _repositories_path_key = "odoo_repository_storage_path"
+    # Number of repositories checked at the same time for upstream changes
+    _remote_heads_workers = 8
 
     display_name = fields.Char(compute="_compute_display_name", store=True)
     active = fields.Boolean(default=True)
@@ -74,12 +85,53 @@ class OdooRepository(models.Model):
         string="Odoo Version",
         domain=[("odoo_version", "=", True)],
     )
+    partial_clone = fields.Boolean(
+        help=(
+            "Clone only the history of the repository (commits and trees), "
+            "files are downloaded only when the scanner analyzes them. "
+            "This saves a lot of disk space and bandwidth on big repositories."
+        ),
+        default=False,
+    )
+    object_store = fields.Char(
+        string="Shared Object Store",
+        help=(
+            "Name of the Git object store shared with related repositories "
+            "(forks), so their common history is stored once on the disk. "
+            "By default, repositories having the same name share a store when "
+            "the 'Share Git objects between forks' setting is enabled."
+        ),
+    )
+    disk_usage = fields.Integer(
+        string="Disk Usage (MB)",
+        help=(
+            "Disk space used by the local clone of this repository, "
+            "recorded by the maintenance of the clones."
+        ),
+        readonly=True,
+    )
+    last_scan_date = fields.Datetime(
+        help="Last time a branch of this repository has been scanned.",
+        readonly=True,
+    )
+    disk_space_saved = fields.Integer(
+        string="Disk Space Saved (MB)",
+        help="Estimated disk space saved by the partial clone.",
+        readonly=True,
+    )
     active = fields.Boolean(default=True)
     addons_path_ids = fields.Many2many(
         comodel_name="odoo.repository.addons_path",
         string="Addons Path",
         help="Relative path of folders in this repository hosting Odoo modules",
     )
+    discover_addons_paths = fields.Boolean(
+        help=(
+            "Look for folders hosting modules at any depth of the scanned "
+            "branches, and add them to the addons paths."
+        ),
+        default=False,
+    )
     branch_ids = fields.One2many(
         comodel_name="odoo.repository.branch",
         inverse_name="repository_id",
@@ -147,8 +199,80 @@ class OdooRepository(models.Model):
         repositories = self.search([("to_scan", "=", True)])
         if not branches:
             branches = self._get_odoo_branches_to_clone().mapped("name")
+        if force:
+            for repo in repositories:
+                repo.action_scan(branches=branches, force=force)
+            return
+        # Scan only repositories/branches which changed upstream. Other jobs
+        # (see `_create_jobs`) are still created for unchanged repositories.
+        branches_to_scan = repositories._get_branches_to_scan(branches)
         for repo in repositories:
-            repo.action_scan(branches=branches, force=force)
+            repo._delay_jobs(branches_to_scan.get(repo, []))
+
+    def _get_branches_to_scan(self, branches):
+        """Return the branches that moved upstream since their last scan.
+
+        Remote heads of all repositories are listed concurrently (without
+        cloning or fetching them), and compared to the last scanned commits.
+        It returns a dictionary `{repository: [branch, ...]}` containing only
+        repositories having branches to scan.
+        """
+        self._check_config()
+        repositories_path = self.env["ir.config_parameter"].get_param(
+            self._repositories_path_key
+        )
+        scanners = {}
+        for repo in self:
+            repo_branches = branches
+            if repo.clone_branch_id:
+                repo_branches = [repo.clone_branch_id.name]
+            scanners[repo] = BaseScanner(
+                org=repo.org_id.name,
+                name=repo.name,
+                clone_url=repo.clone_url,
+                branches=repo_branches,
+                repositories_path=repositories_path,
+                ssh_key=repo.ssh_key_id.private_key,
+            )
+        with ThreadPoolExecutor(max_workers=self._remote_heads_workers) as executor:
+            futures = {
+                repo: executor.submit(scanner._get_remote_heads)
+                for repo, scanner in scanners.items()
+            }
+        res = {}
+        for repo, future in futures.items():
+            try:
+                remote_heads = future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                # Let the scanner deal with the error
+                _logger.warning(
+                    "Unable to list remote heads of %s: %s", repo.display_name, exc
+                )
+                res[repo] = scanners[repo].branches
+                continue
+            last_scanned_commits = {
+                repo_branch.branch_id.name: repo_branch.last_scanned_commit
+                for repo_branch in repo.branch_ids
+            }
+            repo_branches = []
+            for branch, commit in remote_heads.items():
+                odoo_branch = branch
+                if repo.clone_branch_id:
+                    odoo_branch = repo.odoo_version_id.name
+                if last_scanned_commits.get(odoo_branch) != commit:
+                    repo_branches.append(branch)
+            if repo_branches:
+                res[repo] = repo_branches
+        _logger.info(
+            "%s repositories/branches to scan: %s",
+            sum(len(repo_branches) for repo_branches in res.values()),
+            ", ".join(
+                f"{repo.display_name}#{branch}"
+                for repo, repo_branches in res.items()
+                for branch in repo_branches
+            ),
+        )
+        return res
 
     def _check_config(self):
         # Check the configuration of repositories folder
@@ -176,12 +300,16 @@ class OdooRepository(models.Model):
             branches = self._get_odoo_branches_to_clone().mapped("name")
         if force:
             self._reset_scanned_commits()
-        # Scan repository branches sequentially as they need to be checked out
-        # to perform the analysis
-        jobs = self._create_jobs(branches)
-        chain(*jobs).delay()
+        self._delay_jobs(branches)
         return True
 
+    def _delay_jobs(self, branches):
+        """Enqueue the jobs of the repository (see `_create_jobs`)."""
+        self.ensure_one()
+        jobs = self._create_jobs(branches)
+        if jobs:
+            chain(*jobs).delay()
+
     def _reset_scanned_commits(self):
         """Reset the scanned commits.
 
@@ -193,25 +321,186 @@ class OdooRepository(models.Model):
         self.branch_ids.module_ids.sudo().write({"last_scanned_commit": False})
 
     def _create_jobs(self, branches):
+        """Return the jobs to chain to scan the repository.
+
+        Repository branches are scanned in parallel as modules are analyzed
+        from Git objects (no checkout), so their jobs are grouped.
+        `branches` can be empty when no branch has to be scanned, overrides
+        being then free to return jobs which do not depend on the scan.
+        """
         self.ensure_one()
-        jobs = []
+        branch_jobs = []
         for branch in branches:
             delayable = self.delayable(
                 description=f"Scan {self.display_name}#{branch}",
                 identity_key=identity_exact,
             )
             job = delayable._scan_branch(branch)
-            jobs.append(job)
-        return jobs
+            branch_jobs.append(job)
+        if not branch_jobs:
+            return []
+        return [group(*branch_jobs)]
 
     def _scan_branch(self, branch):
         """Scan a repository branch"""
         try:
             params = self._prepare_scanner_parameters(branch)
             scanner = RepositoryScannerOdooEnv(**params)
-            return scanner.scan()
+            res = self._run_scanner(scanner)
         except Exception as exc:
             raise RetryableJobError("Scanner error") from exc
+        self.sudo().last_scan_date = fields.Datetime.now()
+        return res
+
+    def _run_scanner(self, scanner):
+        """Run the scan of `scanner`, in a child process if configured.
+
+        The child process is bounded in memory and CPU time, so the Git and
+        analysis work cannot exhaust the Odoo worker. Data are still written
+        by the Odoo worker, the hooks of the scanner being run by it.
+        """
+        self.env["odoo.module.branch"]._preload_references()
+        ir_config = self.env["ir.config_parameter"]
+        if not ir_config.get_param("odoo_repository_scanner_isolated"):
+            return scanner.scan()
+        return isolation.run_scan(
+            scanner,
+            memory_limit=int(ir_config.get_param("odoo_repository_scanner_memory", 0)),
+            cpu_time_limit=int(
+                ir_config.get_param("odoo_repository_scanner_cpu_time", 0)
+            ),
+        )
+
+    def _update_disk_usage(self, scanner):
+        """Record the disk space used by the local clone of the repositories.
+
+        `self` are the repositories sharing this clone (see `_get_clone_key`).
+        """
+        repo = self[:1]
+        disk_usage = scanner._get_disk_usage()
+        values = {"disk_usage": disk_usage // 1024**2, "disk_space_saved": 0}
+        if scanner.is_partial_clone and repo.repo_type == "github":
+            # GitHub returns the size (in KB) of the whole repository
+            try:
+                data = github.request(self.env, f"repos/{repo.org_id.name}/{repo.name}")
+            except (RuntimeError, requests.exceptions.RequestException) as exc:
+                _logger.warning(
+                    "Unable to get the size of %s: %s", repo.display_name, exc
+                )
+            else:
+                disk_space_saved = max(data["size"] * 1024 - disk_usage, 0)
+                values["disk_space_saved"] = disk_space_saved // 1024**2
+        self.sudo().write(values)
+
+    def _get_clone_key(self):
+        """Return the key identifying the local clone of the repository.
+
+        Clones are stored by organization and name, so repositories of
+        different Odoo versions (see `odoo_version_id`) share the same clone.
+        """
+        self.ensure_one()
+        return (self.org_id.name, self.name)
+
+    def _is_clone_used(self):
+        """Check if the clone of the repositories `self` is still scanned."""
+        return any(repo.active and repo.to_scan for repo in self)
+
+    @api.model
+    def cron_maintenance(self):
+        """Maintain the local clones of the repositories.
+
+        Clones of repositories to scan are repacked (see `BaseScanner.maintain`)
+        and their disk usage is recorded. Then if the clones exceed the disk
+        budget (MB) defined by the 'odoo_repository_storage_budget' system
+        parameter, clones of repositories not scanned anymore (archived or
+        not to scan) are removed, the least recently scanned first.
+        Repositories sharing the same clone (see `_get_clone_key`) are
+        handled together: their clone is maintained and counted once, and
+        removed only if none of them is scanned anymore.
+        """
+        self._check_config()
+        ir_config = self.env["ir.config_parameter"]
+        budget = int(ir_config.get_param("odoo_repository_storage_budget", 0))
+        repositories = self.with_context(active_test=False).search([])
+        clones = defaultdict(self.browse)
+        for repo in repositories:
+            clones[repo._get_clone_key()] |= repo
+        for clone_repos in clones.values():
+            scanner = clone_repos._get_maintenance_scanner()
+            if not scanner.is_cloned:
+                clone_repos.filtered("disk_usage").sudo().write(
+                    {"disk_usage": 0, "disk_space_saved": 0}
+                )
+                continue
+            if clone_repos._is_clone_used():
+                try:
+                    scanner.maintain()
+                except Exception as exc:  # pylint: disable=broad-except
+                    _logger.warning("Unable to maintain %s: %s", scanner.full_name, exc)
+            clone_repos._update_disk_usage(scanner)
+            # Commit after each clone as the maintenance could be long
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+        if not budget:
+            return True
+        total_disk_usage = sum(
+            max(clone_repos.mapped("disk_usage")) for clone_repos in clones.values()
+        )
+        unused_clones = sorted(
+            (
+                clone_repos
+                for clone_repos in clones.values()
+                if max(clone_repos.mapped("disk_usage"))
+                and not clone_repos._is_clone_used()
+            ),
+            key=lambda clone_repos: max(
+                repo.last_scan_date or datetime.datetime.min for repo in clone_repos
+            ),
+        )
+        for clone_repos in unused_clones:
+            if total_disk_usage <= budget:
+                break
+            clone_repos._get_maintenance_scanner()._remove_clone()
+            total_disk_usage -= max(clone_repos.mapped("disk_usage"))
+            clone_repos.sudo().write({"disk_usage": 0, "disk_space_saved": 0})
+        if total_disk_usage > budget:
+            _logger.warning(
+                "Local clones use %s MB, exceeding the storage budget of %s MB",
+                total_disk_usage,
+                budget,
+            )
+        return True
+
+    def _get_maintenance_scanner(self):
+        """Return the scanner used to maintain the clone of the repositories.
+
+        `self` are the repositories sharing this clone (see `_get_clone_key`),
+        the branches of all of them being kept.
+        """
+        # Prefer the settings (clone URL, SSH key...) of a scanned repository
+        repo = self.sorted(lambda repo: not (repo.active and repo.to_scan))[:1]
+        repo.ensure_one()
+        repositories_path = self.env["ir.config_parameter"].get_param(
+            self._repositories_path_key
+        )
+        odoo_branches = self._get_odoo_branches_to_clone().mapped("name")
+        branches = set()
+        for rec in self:
+            if rec.clone_branch_id:
+                branches.add(rec.clone_branch_id.name)
+            else:
+                branches.update(odoo_branches)
+        return BaseScanner(
+            org=repo.org_id.name,
+            name=repo.name,
+            clone_url=repo.clone_url,
+            branches=sorted(branches),
+            repositories_path=repositories_path,
+            ssh_key=repo.ssh_key_id.private_key,
+            partial_clone=repo.partial_clone,
+            git_backend=self.env["ir.config_parameter"].get_param(
+                "odoo_repository_git_backend", "gitpython"
+            ),
+        )
 
     def _prepare_scanner_parameters(self, branch):
         ir_config = self.env["ir.config_parameter"]
@@ -235,9 +524,51 @@ class OdooRepository(models.Model):
             "repositories_path": repositories_path,
             "ssh_key": self.ssh_key_id.private_key,
             "github_token": github_token,
+            "partial_clone": self.partial_clone,
+            "git_backend": ir_config.get_param(
+                "odoo_repository_git_backend", "gitpython"
+            ),
+            "object_store": self._get_object_store(),
+            "bundles_path": ir_config.get_param("odoo_repository_bundles_path"),
+            "commit_batch_size": int(
+                ir_config.get_param("odoo_repository_commit_batch_size", 50)
+            ),
+            "commit_interval": int(
+                ir_config.get_param("odoo_repository_commit_interval", 60)
+            ),
+            "discover_addons_paths": self.discover_addons_paths,
+            "analysis_cache_size": int(
+                ir_config.get_param("odoo_repository_analysis_cache_size", 10000)
+            ),
+            "workers": int(ir_config.get_param("odoo_repository_scanner_workers", 0)),
+            "worker_memory_limit": int(
+                ir_config.get_param("odoo_repository_scanner_worker_memory", 1024)
+            ),
+            "sloc_backend": ir_config.get_param(
+                "odoo_repository_sloc_backend", "builtin"
+            ),
             "env": self.env,
         }
 
+    def _get_object_store(self):
+        """Return the name of the object store shared with related repositories.
+
+        Without explicit store, a repository shares the objects of the other
+        repositories having the same name (forks).
+        """
+        self.ensure_one()
+        ir_config = self.env["ir.config_parameter"].sudo()
+        if not ir_config.get_param("odoo_repository_shared_objects"):
+            return None
+        if self.object_store:
+            return self.object_store
+        # Repositories of other Odoo versions share the same clone, they are
+        # not forks (see `_get_clone_key`)
+        forks_count = self.with_context(active_test=False).search_count(
+            [("name", "=", self.name), ("org_id", "!=", self.org_id.id)]
+        )
+        return self.name if forks_count else None
+
     def action_force_scan(self, branches=None):
         """Force the scan of the repositories.
 
@@ -276,6 +607,7 @@ class OdooRepository(models.Model):
                     self._import_data(data)
 
     def _import_data(self, data):
+        self.env["odoo.module.branch"]._preload_references()
         for module_data in data:
             # TODO Move these methods to 'odoo.module.branch'?
             values = self._prepare_module_branch_values(module_data)
@@ -7,12 +7,98 @@ from odoo import fields, models
 class ResConfigSettings(models.TransientModel):
     _inherit = "res.config.settings"
 
+    # Integer settings for which 0 has a meaning (e.g. to disable a feature)
+    # while their default is not 0: Odoo removes the system parameter of an
+    # integer setting set to 0, so its default would be used instead.
+    _zero_config_parameter_fields = (
+        "config_odoo_repository_analysis_cache_size",
+        "config_odoo_repository_commit_batch_size",
+        "config_odoo_repository_commit_interval",
+    )
+
     config_odoo_repository_storage_path = fields.Char(
         string="Storage local path", config_parameter="odoo_repository_storage_path"
     )
+    config_odoo_repository_bundles_path = fields.Char(
+        string="Bundles path", config_parameter="odoo_repository_bundles_path"
+    )
     config_odoo_repository_github_token = fields.Char(
         string="GitHub Token", config_parameter="odoo_repository_github_token"
     )
     config_odoo_repository_main_node_url = fields.Char(
         string="Endpoint URL", config_parameter="odoo_repository_main_node_url"
     )
+    config_odoo_repository_analysis_cache_size = fields.Integer(
+        string="Analysis cache size",
+        config_parameter="odoo_repository_analysis_cache_size",
+        default=10000,
+    )
+    config_odoo_repository_scanner_isolated = fields.Boolean(
+        string="Run scanners in a child process",
+        config_parameter="odoo_repository_scanner_isolated",
+    )
+    config_odoo_repository_scanner_memory = fields.Integer(
+        string="Scanner memory (MB)",
+        config_parameter="odoo_repository_scanner_memory",
+        default=0,
+    )
+    config_odoo_repository_scanner_cpu_time = fields.Integer(
+        string="Scanner CPU time (s)",
+        config_parameter="odoo_repository_scanner_cpu_time",
+        default=0,
+    )
+    config_odoo_repository_scanner_workers = fields.Integer(
+        string="Scanner workers",
+        config_parameter="odoo_repository_scanner_workers",
+        default=0,
+    )
+    config_odoo_repository_scanner_worker_memory = fields.Integer(
+        string="Scanner worker memory (MB)",
+        config_parameter="odoo_repository_scanner_worker_memory",
+        default=1024,
+    )
+    config_odoo_repository_commit_batch_size = fields.Integer(
+        string="Commit batch size",
+        config_parameter="odoo_repository_commit_batch_size",
+        default=50,
+    )
+    config_odoo_repository_commit_interval = fields.Integer(
+        string="Commit interval (s)",
+        config_parameter="odoo_repository_commit_interval",
+        default=60,
+    )
+    config_odoo_repository_sloc_backend = fields.Selection(
+        selection=[
+            ("builtin", "Built-in"),
+            ("pygount", "pygount"),
+        ],
+        string="SLOC counter",
+        config_parameter="odoo_repository_sloc_backend",
+        default="builtin",
+    )
+    config_odoo_repository_storage_budget = fields.Integer(
+        string="Storage budget (MB)",
+        config_parameter="odoo_repository_storage_budget",
+        default=0,
+    )
+    config_odoo_repository_shared_objects = fields.Boolean(
+        string="Share Git objects between forks",
+        config_parameter="odoo_repository_shared_objects",
+    )
+    config_odoo_repository_git_backend = fields.Selection(
+        selection=[
+            ("gitpython", "GitPython"),
+            ("libgit2", "libgit2 (pygit2)"),
+        ],
+        string="Git backend",
+        config_parameter="odoo_repository_git_backend",
+        default="gitpython",
+    )
+
+    def set_values(self):
+        res = super().set_values()
+        ir_config = self.env["ir.config_parameter"].sudo()
+        for field_name in self._zero_config_parameter_fields:
+            if not self[field_name]:
+                ir_config.set_param(self._fields[field_name].config_parameter, "0")
+        return res
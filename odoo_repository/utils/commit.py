@@ -0,0 +1,35 @@
+# Copyright 2023 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import time
+
+
+class BatchCommitter:
+    """Commit the transaction of `env` once per batch of writes.
+
+    The transaction is committed every `batch_size` writes or every
+    `interval` seconds, whichever comes first (0 to disable the limit).
+    If the job is interrupted, only the writes of the current batch are
+    lost: their rollback leaves the data as they were at the last commit.
+    """
+
+    def __init__(self, env, batch_size=1, interval=0):
+        self.env = env
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = 0
+        self.last_commit_time = time.monotonic()
+
+    def add(self):
+        """Record a write, committing the batch if it is complete."""
+        self.pending += 1
+        if (self.batch_size and self.pending >= self.batch_size) or (
+            self.interval and time.monotonic() - self.last_commit_time >= self.interval
+        ):
+            self.commit()
+
+    def commit(self):
+        """Commit the current batch."""
+        self.env.cr.commit()  # pylint: disable=invalid-commit
+        self.pending = 0
+        self.last_commit_time = time.monotonic()
@@ -0,0 +1,76 @@
+# Copyright 2023 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import contextlib
+import copy
+import weakref
+
+# Caches by database cursor
+_caches = weakref.WeakKeyDictionary()
+
+
+class ReferenceCache:
+    """Cache of the IDs of reference records by model and name.
+
+    There is one cache per database cursor (see `get`). IDs resolved in the
+    current transaction are kept apart until it is committed, and dropped if
+    it is rolled back, entirely or to a savepoint opened with `savepoint`, as
+    their records could then not exist anymore.
+    """
+
+    def __init__(self):
+        # {model: {name: id}}
+        self.committed = {}
+        self.pending = {}
+        self.hooked = False
+
+    @classmethod
+    def get(cls, cr):
+        """Return the cache of the cursor `cr`."""
+        cache = _caches.get(cr)
+        if cache is None:
+            cache = _caches[cr] = cls()
+        # Callbacks of the cursor are cleared on each commit or rollback, so
+        # they are registered again for each transaction
+        if not cache.hooked:
+            cr.postcommit.add(cache._on_commit)
+            cr.postrollback.add(cache._on_rollback)
+            cache.hooked = True
+        return cache
+
+    def get_ids(self, model, names):
+        """Return the known IDs of `names` as a dictionary `{name: id}`."""
+        committed = self.committed.get(model, {})
+        pending = self.pending.get(model, {})
+        res = {}
+        for name in names:
+            id_ = committed.get(name) or pending.get(name)
+            if id_:
+                res[name] = id_
+        return res
+
+    def add(self, model, ids):
+        """Record the IDs `{name: id}` resolved in the current transaction."""
+        self.pending.setdefault(model, {}).update(ids)
+
+    @contextlib.contextmanager
+    def savepoint(self, cr):
+        """Open a savepoint on `cr`, forgetting the IDs resolved in it if it
+        is rolled back."""
+        pending = copy.deepcopy(self.pending)
+        try:
+            with cr.savepoint():
+                yield
+        except Exception:
+            self.pending = pending
+            raise
+
+    def _on_commit(self):
+        for model, ids in self.pending.items():
+            self.committed.setdefault(model, {}).update(ids)
+        self.pending = {}
+        self.hooked = False
+
+    def _on_rollback(self):
+        self.pending = {}
+        self.hooked = False
@@ -2,6 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
 from ..lib.scanner import RepositoryScanner
+from .commit import BatchCommitter
 
 
 class RepositoryScannerOdooEnv(RepositoryScanner):
@@ -9,11 +10,19 @@ class RepositoryScannerOdooEnv(RepositoryScanner):
 
     This class takes an additional `env` parameter (`odoo.api.Environment`)
     used to request Odoo, and implement required methods to use it.
+    Scanned data are committed by batch (see `BatchCommitter`), the
+    `commit_batch_size` and `commit_interval` parameters defining the size
+    of a batch.
     """
 
     def __init__(self, *args, **kwargs):
         if kwargs.get("env"):
             self.env = kwargs.pop("env")
+        self.committer = BatchCommitter(
+            getattr(self, "env", None),
+            batch_size=kwargs.pop("commit_batch_size", 1),
+            interval=kwargs.pop("commit_interval", 0),
+        )
         super().__init__(*args, **kwargs)
 
     def _get_odoo_repository_id(self):
@@ -23,6 +32,18 @@ class RepositoryScannerOdooEnv(RepositoryScanner):
             .id
         )
 
+    def _add_odoo_repository_addons_paths(self, repo_id, addons_paths_data):
+        addons_path_model = self.env["odoo.repository.addons_path"]
+        addons_paths = addons_path_model.browse()
+        for values in addons_paths_data:
+            domain = [(field, "=", value) for field, value in values.items()]
+            addons_path = addons_path_model.search(domain, limit=1)
+            if not addons_path:
+                addons_path = addons_path_model.create(values)
+            addons_paths |= addons_path
+        repo = self.env["odoo.repository"].browse(repo_id)
+        repo.sudo().addons_path_ids = [(4, id_) for id_ in addons_paths.ids]
+
     def _get_odoo_branch_id(self, repo_id, branch):
         repo = self.env["odoo.repository"].browse(repo_id)
         if repo.clone_branch_id and repo.odoo_version_id:
@@ -57,27 +78,30 @@ class RepositoryScannerOdooEnv(RepositoryScanner):
         repo_branch = repo_branch_model.browse(repo_branch_id)
         return repo_branch.last_scanned_commit
 
-    def _get_module_last_scanned_commit(self, repo_branch_id, module_name):
+    def _get_modules_last_scanned_commits(self, repo_branch_id):
         module_branch_model = self.env["odoo.module.branch"]
-        args = [
-            ("repository_branch_id", "=", repo_branch_id),
-            ("module_name", "=", module_name),
-        ]
-        module = module_branch_model.search(args)
-        return module.last_scanned_commit
+        args = [("repository_branch_id", "=", repo_branch_id)]
+        modules = module_branch_model.search_read(
+            args, ["module_name", "last_scanned_commit"]
+        )
+        return {
+            module["module_name"]: module["last_scanned_commit"] for module in modules
+        }
 
     def _push_scanned_data(self, repo_branch_id, module, data):
         res = self.env["odoo.module.branch"].push_scanned_data(
             repo_branch_id, module, data
         )
-        # Commit after each module
-        self.env.cr.commit()  # pylint: disable=invalid-commit
-        return res
+        self.committer.add()
+        # Return the ID only, a recordset cannot be sent to an isolated
+        # scanner process
+        return res.id
 
     def _update_last_scanned_commit(self, repo_branch_id, last_fetched_commit):
         repo_branch_model = self.env["odoo.repository.branch"]
         repo_branch = repo_branch_model.browse(repo_branch_id)
         repo_branch.last_scanned_commit = last_fetched_commit
-        # Commit after each repository/branch
-        self.env.cr.commit()  # pylint: disable=invalid-commit
+        # Commit the last batch of modules with the repository/branch, so it
+        # is flagged as scanned only once all its modules are saved
+        self.committer.commit()
         return True
@@ -53,7 +53,7 @@ class OdooRepository(models.Model):
         """Scan repository branches to collect modules migration data."""
         params = self._prepare_migration_scanner_parameters(migration_path)
         scanner = MigrationScannerOdooEnv(**params)
-        return scanner.scan()
+        return self._run_scanner(scanner)
 
     def _prepare_migration_scanner_parameters(self, migration_path):
         ir_config = self.env["ir.config_parameter"]
@@ -69,6 +69,18 @@ class OdooRepository(models.Model):
             "repositories_path": repositories_path,
             "ssh_key": self.ssh_key_id.private_key,
             "github_token": github_token,
+            "partial_clone": self.partial_clone,
+            "git_backend": ir_config.get_param(
+                "odoo_repository_git_backend", "gitpython"
+            ),
+            "object_store": self._get_object_store(),
+            "bundles_path": ir_config.get_param("odoo_repository_bundles_path"),
+            "commit_batch_size": int(
+                ir_config.get_param("odoo_repository_commit_batch_size", 50)
+            ),
+            "commit_interval": int(
+                ir_config.get_param("odoo_repository_commit_interval", 60)
+            ),
             "env": self.env,
         }
 
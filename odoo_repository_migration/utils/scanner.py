@@ -2,6 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
 from odoo.addons.odoo_repository.lib.scanner import MigrationScanner
+from odoo.addons.odoo_repository.utils.commit import BatchCommitter
 
 
 class MigrationScannerOdooEnv(MigrationScanner):
@@ -9,11 +10,19 @@ class MigrationScannerOdooEnv(MigrationScanner):
 
     This class takes an additional `env` parameter (`odoo.api.Environment`)
     used to request Odoo, and implement required methods to use it.
+    Migration data are committed by batch (see `BatchCommitter`), the
+    `commit_batch_size` and `commit_interval` parameters defining the size
+    of a batch.
     """
 
     def __init__(self, *args, **kwargs):
         if kwargs.get("env"):
             self.env = kwargs.pop("env")
+        self.committer = BatchCommitter(
+            getattr(self, "env", None),
+            batch_size=kwargs.pop("commit_batch_size", 1),
+            interval=kwargs.pop("commit_interval", 0),
+        )
         super().__init__(*args, **kwargs)
 
     def _get_odoo_repository_id(self) -> int:
@@ -78,6 +87,7 @@ class MigrationScannerOdooEnv(MigrationScanner):
         res = self.env["odoo.module.branch.migration"].push_scanned_data(
             module_branch_id, data
         )
-        # Commit after each scan
-        self.env.cr.commit()  # pylint: disable=invalid-commit
-        return res
+        self.committer.add()
+        # Return the ID only, a recordset cannot be sent to an isolated
+        # scanner process
+        return res.id